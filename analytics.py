@@ -0,0 +1,122 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+# === Market rollups ===
+# Per-Dự án and per-Loại hình aggregates: listing count, sum and count of Giá, Diện tích,
+# Lợi nhuận and price per m², and each group's prices kept sorted for the median. Built in
+# one vectorized pass over the table, then kept current row by row by the store's add,
+# update and delete, so the analytics section never groups the full table on a rerun.
+DIMENSIONS = ["Dự án", "Loại hình"]
+METRICS = ["Giá", "Diện tích", "Lợi nhuận", "Giá/m²"]
+EMPTY_LABEL = "(trống)"
+
+
+def _label(value):
+    if value is None or value != value or str(value) == "":
+        return EMPTY_LABEL
+    return str(value)
+
+
+def _metrics(df):
+    # (rows, METRICS) float64 matrix; NaN where a value is missing
+    gia = df["Giá"].to_numpy(dtype="float64", na_value=np.nan)
+    area = df["Diện tích"].to_numpy(dtype="float64", na_value=np.nan)
+    profit = df["Lợi nhuận"].to_numpy(dtype="float64", na_value=np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        per_m2 = np.where(area > 0, gia / area, np.nan)
+    return np.column_stack([gia, area, profit, per_m2])
+
+
+class Group:
+    __slots__ = ("n", "sums", "counts", "prices")
+
+    def __init__(self, n=0, sums=None, counts=None, prices=None):
+        self.n = n
+        self.sums = np.zeros(len(METRICS)) if sums is None else sums
+        self.counts = np.zeros(len(METRICS), dtype=np.int64) if counts is None else counts
+        self.prices = np.empty(0) if prices is None else prices  # sorted, NaN excluded
+
+    def median(self):
+        k = len(self.prices)
+        if k == 0:
+            return np.nan
+        return self.prices[k // 2] if k % 2 else (self.prices[k // 2 - 1] + self.prices[k // 2]) / 2
+
+
+class Rollups:
+    def __init__(self, df):
+        self._lock = threading.Lock()
+        self.groups = {dim: {} for dim in DIMENSIONS}
+        if len(df):
+            self._build(df)
+
+    def _build(self, df):
+        metrics = _metrics(df)
+        for dim in DIMENSIONS:
+            codes, uniques = pd.factorize(df[dim])
+            k = len(uniques)
+            n = np.bincount(codes[codes >= 0], minlength=k)
+            sums = np.zeros((k, len(METRICS)))
+            counts = np.zeros((k, len(METRICS)), dtype=np.int64)
+            for j in range(len(METRICS)):
+                valid = (codes >= 0) & ~np.isnan(metrics[:, j])
+                sums[:, j] = np.bincount(codes[valid], weights=metrics[valid, j], minlength=k)
+                counts[:, j] = np.bincount(codes[valid], minlength=k)
+            # Prices sorted within each group: one lexsort, then a slice per group
+            valid = (codes >= 0) & ~np.isnan(metrics[:, 0])
+            order = np.lexsort((metrics[valid, 0], codes[valid]))
+            sorted_codes = codes[valid][order]
+            sorted_prices = metrics[valid, 0][order]
+            bounds = np.searchsorted(sorted_codes, np.arange(k + 1))
+            groups = self.groups[dim]
+            for i, value in enumerate(uniques):
+                if n[i]:
+                    groups[_label(value)] = Group(int(n[i]), sums[i], counts[i], sorted_prices[bounds[i]:bounds[i + 1]].copy())
+
+    def _apply(self, row, sign):
+        values = _metrics(pd.DataFrame([row]))[0]
+        valid = ~np.isnan(values)
+        with self._lock:
+            for dim in DIMENSIONS:
+                key = _label(row[dim])
+                group = self.groups[dim].get(key)
+                if group is None:
+                    group = self.groups[dim][key] = Group()
+                group.n += sign
+                group.sums[valid] += sign * values[valid]
+                group.counts[valid] += sign
+                if valid[0]:
+                    pos = np.searchsorted(group.prices, values[0])
+                    if sign > 0:
+                        group.prices = np.insert(group.prices, pos, values[0])
+                    elif pos < len(group.prices):
+                        group.prices = np.delete(group.prices, pos)
+                if group.n <= 0:
+                    del self.groups[dim][key]
+
+    def add(self, row):
+        self._apply(row, 1)
+
+    def remove(self, row):
+        self._apply(row, -1)
+
+    def table(self, dim):
+        with self._lock:
+            items = [(key, g.n, g.sums.copy(), g.counts.copy(), g.median()) for key, g in self.groups[dim].items()]
+        if not items:
+            return pd.DataFrame(columns=["Số tin", "Giá TB", "Giá trung vị", "Diện tích TB", "Giá/m² TB", "Tổng lợi nhuận"])
+        keys, n, sums, counts, medians = zip(*items)
+        sums, counts = np.array(sums), np.array(counts)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            means = np.where(counts > 0, sums / counts, np.nan)
+        table = pd.DataFrame({
+            "Số tin": n,
+            "Giá TB": means[:, 0],
+            "Giá trung vị": medians,
+            "Diện tích TB": means[:, 1],
+            "Giá/m² TB": means[:, 3],
+            "Tổng lợi nhuận": sums[:, 2],
+        }, index=pd.Index(keys, name=dim))
+        return table.sort_values("Số tin", ascending=False, kind="stable")
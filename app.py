@@ -532,67 +532,123 @@ import streamlit as st
 import pandas as pd
 import os
 import shutil
-import zipfile
-import io
-from PIL import Image
-from datetime import datetime, timedelta
+from html import escape
+from datetime import timedelta
+from storage import ConflictError, ValidationError, format_number, open_store, read_csv, validate_listing
+from images import ThumbnailCache, ingest_uploads
+from manifest import ImageManifest, listing_folders
+import analytics
+import backup
+import bulk_import
+import profiling
+from share import ShareExporter
 
 # === Constants ===
 CSV_FILE = "du_lieu_bat_dong_san.csv"
 IMAGE_DIR = "anh_nha"
 SHARED_DIR = "chia_se"
 BACKUP_DIR = "backups"
+IMPORT_IMAGES_ROOT = os.environ.get("BDS_IMPORT_IMAGES_ROOT", "anh_nhap")  # bulk import reads photos only from here
 IMAGE_WIDTH = 120
+PAGE_SIZES = [10, 20, 50, 100]
+BACKUP_MODE = os.environ.get("BDS_BACKUP_MODE", "zip")  # "zip" (full snapshot) or "incremental"
+BACKUP_KEEP = int(os.environ.get("BDS_BACKUP_KEEP", "20"))  # incremental generations kept
+AUTO_BACKUP_DAYS = float(os.environ.get("BDS_AUTO_BACKUP_DAYS", "3"))  # 0 turns automatic backups off
+PROFILE_DUMP = "profile_stats"  # written as profile_stats.json / profile_stats.prom when profiling
+# With server.enableStaticServing (see .streamlit/config.toml) thumbnails live under static/
+# and the browser fetches them straight from disk; their names change with the source photo,
+# so a URL never goes stale and the browser can keep its copy
+STATIC_SERVING = st.get_option("server.enableStaticServing")
+THUMB_DIR = os.path.join("static", "thumbs") if STATIC_SERVING else ".thumbs"
+EXPORT_DIR = ".exports"
+MANIFEST_FILE = "anh_nha_manifest.sqlite"  # photos of every listing, so renders never list folders
+THUMB_SCALES = (1, 2)  # generated at IMAGE_WIDTH and 2x for sharp display on high-DPI screens
+THUMB_CACHE_MB = int(os.environ.get("BDS_THUMB_CACHE_MB", "200"))
+STORAGE_BACKEND = os.environ.get("BDS_STORAGE", "csv")  # "csv" or "sqlite"
+COLUMNAR_SIDECAR = os.environ.get("BDS_COLUMNAR", "1") == "1"  # Arrow copy of the CSV for fast startup
+QUERY_CACHE_MB = int(os.environ.get("BDS_QUERY_CACHE_MB", "64"))  # search results shared by all sessions
+
+# Opt-in per-rerun profiling: BDS_PROFILE=1 or ?profile=1
+# A run that ended in st.rerun() never reaches the panel at the bottom; it is recorded here
+if "profiler" in st.session_state:
+    st.session_state.profiler.finish("rerun")
+prof = st.session_state.profiler = profiling.RunProfiler(os.environ.get("BDS_PROFILE") == "1" or st.query_params.get("profile") == "1")
 
 # Ensure necessary directories
 for d in [IMAGE_DIR, SHARED_DIR, BACKUP_DIR]:
     os.makedirs(d, exist_ok=True)
 
 # === Load or Create DataFrame ===
-if os.path.exists(CSV_FILE):
-    df = pd.read_csv(CSV_FILE)
-else:
-    df = pd.DataFrame(columns=[
-        "Loại hình", "Dự án", "Giá", "Diện tích", "SĐT", "Lợi nhuận", "Notice", "Thư mục ảnh"
-    ])
+# Served from the process-wide store; only re-read when the data changes on disk
+@st.cache_resource
+def get_store():
+    return open_store(CSV_FILE, STORAGE_BACKEND, sidecar=COLUMNAR_SIDECAR,
+                      query_cache_bytes=QUERY_CACHE_MB * 1024 * 1024)
+
+@st.cache_resource
+def get_thumbnails():
+    return ThumbnailCache(THUMB_DIR, max_bytes=THUMB_CACHE_MB * 1024 * 1024)
+
+@st.cache_resource
+def get_manifest():
+    return ImageManifest(MANIFEST_FILE)
+
+@st.cache_resource
+def get_sharer():
+    return ShareExporter(SHARED_DIR)
+
+store = get_store()
+thumbs = get_thumbnails()
+manifest = get_manifest()
+sharer = get_sharer()
+df = store.load()
+prof.lap("csv_load")
 
 def save_data():
-    df.to_csv(CSV_FILE, index=False)
+    # Full rewrite, only needed when the whole table is replaced (restore)
+    store.replace(df)
 
 # === Backup Function ===
-def create_backup():
-    today = datetime.today()
-    # Save CSV
-    csv_backup_name = today.strftime("%Y%m%d") + "_backup.csv"
-    df.to_csv(os.path.join(BACKUP_DIR, csv_backup_name), index=False)
-    # Save images as ZIP
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        for foldername, subfolders, filenames in os.walk(IMAGE_DIR):
-            for filename in filenames:
-                filepath = os.path.join(foldername, filename)
-                arcname = os.path.relpath(filepath, IMAGE_DIR)
-                zip_file.write(filepath, arcname)
-    zip_backup_name = today.strftime("%Y%m%d") + "_images.zip"
-    with open(os.path.join(BACKUP_DIR, zip_backup_name), "wb") as f:
-        f.write(zip_buffer.getvalue())
-
-# === Auto Backup if 3 days passed ===
-def auto_backup():
-    today = datetime.today()
-    backups = sorted([f for f in os.listdir(BACKUP_DIR) if f.endswith("_backup.csv")])
-    if backups:
-        last_backup_date = datetime.strptime(backups[-1][:8], "%Y%m%d")
-        if today - last_backup_date < timedelta(days=3):
-            return  # Recent backup exists
-    create_backup()
-
-auto_backup()
+# Runs on a background thread: the CSV snapshot and the image ZIP are streamed to temp files
+# in BACKUP_DIR and renamed into place, so no request waits for the archive.
+@st.cache_resource
+def get_backup_job():
+    return backup.BackgroundJob("backup")
+
+backup_job = get_backup_job()
+
+def create_backup(progress=None):
+    # Runs inside the backup job; takes its own snapshot of the current data
+    data = store.load().copy()
+    if BACKUP_MODE == "incremental":
+        return backup.create_incremental_backup(data, BACKUP_DIR, IMAGE_DIR, progress=progress, keep=BACKUP_KEEP)
+    return backup.create_backup(data, BACKUP_DIR, IMAGE_DIR, progress=progress)
+
+# === Auto Backup every 3 days ===
+# One scheduler thread per process checks a persisted marker hourly; reruns do no backup work
+@st.cache_resource
+def get_backup_scheduler():
+    return backup.BackupScheduler(BACKUP_DIR, backup_job, create_backup, interval=timedelta(days=AUTO_BACKUP_DAYS)).start()
+
+if AUTO_BACKUP_DAYS > 0:
+    get_backup_scheduler()
+prof.lap("auto_backup")
 
 # === Page setup ===
 st.set_page_config(page_title="Quản lý BĐS", layout="wide")
 st.title("❤️ Anh Yêu Em ❤️")
 
+# === Backup progress ===
+@st.fragment(run_every=1)
+def backup_status():
+    if backup_job.running:
+        st.progress(backup_job.progress, text=f"📦 Đang sao lưu... {backup_job.progress:.0%}")
+    elif backup_job.state == "error":
+        st.error(f"❌ Sao lưu thất bại: {backup_job.error}")
+
+if backup_job.running or backup_job.state == "error":
+    backup_status()
+
 # # === Show Last Backup Info ===
 # backup_files = sorted([f for f in os.listdir(BACKUP_DIR) if f.endswith("_backup.csv")])
 # if backup_files:
@@ -607,6 +663,10 @@ st.title("❤️ Anh Yêu Em ❤️")
 # === UI States ===
 for k in ["reset_form", "search_triggered", "edit_trigger", "edit_index"]:
     st.session_state.setdefault(k, False if k != "edit_index" else None)
+st.session_state.setdefault("edit_version", None)
+st.session_state.setdefault("edit_conflict", False)
+st.session_state.setdefault("page", 1)
+st.session_state.setdefault("page_key", None)
 
 # === Reset Form Logic ===
 if st.session_state.reset_form:
@@ -633,31 +693,89 @@ with st.form("add_form"):
 
     if submitted:
         try:
-            price_val = float(price)
-            area_val = float(area)
-            folder_name = f"{loai_hinh}_{len(df)}"
-            folder_path = os.path.join(IMAGE_DIR, folder_name)
-            os.makedirs(folder_path, exist_ok=True)
-            for uploaded_file in uploaded_files:
-                with open(os.path.join(folder_path, uploaded_file.name), "wb") as f:
-                    f.write(uploaded_file.read())
-            new_data = {
+            new_data = validate_listing({
                 "Loại hình": loai_hinh,
                 "Dự án": du_an,
-                "Giá": price_val,
-                "Diện tích": area_val,
+                "Giá": price,
+                "Diện tích": area,
                 "SĐT": phone,
                 "Lợi nhuận": profit,
                 "Notice": notice,
-                "Thư mục ảnh": folder_path
-            }
-            df = pd.concat([df, pd.DataFrame([new_data])], ignore_index=True)
-            save_data()
+            })
+            listing_id = store.new_id()
+            folder_name = f"{loai_hinh}_{listing_id}"
+            folder_path = os.path.join(IMAGE_DIR, folder_name)
+            _, rejected = ingest_uploads(uploaded_files, folder_path, thumbs, [IMAGE_WIDTH * s for s in THUMB_SCALES])
+            for name, err in rejected.items():
+                st.toast(f"Bỏ qua {name}: không phải ảnh hợp lệ ({err})", icon="⚠️")
+            new_data["Thư mục ảnh"] = folder_path
+            store.append(new_data, listing_id)
+            manifest.scan(listing_id, folder_path)
             st.success("✅ Đã thêm nhà.")
             st.session_state.reset_form = True
             st.rerun()
-        except ValueError:
-            st.error("❌ Vui lòng nhập đúng định dạng Giá và Diện tích.")
+        except ValidationError as e:
+            st.error(f"❌ {e}")
+
+# === Bulk import ===
+# A partner's CSV/XLSX is imported on a background thread: validated chunk by chunk, photos
+# attached in parallel, and the valid rows committed in a single write.
+@st.cache_resource
+def get_import_job():
+    return backup.BackgroundJob("import")
+
+import_job = get_import_job()
+st.session_state.setdefault("import_seen", import_job.finished_at)
+
+with st.expander("📥 Nhập hàng loạt từ CSV/XLSX"):
+    st.caption("Cột giống bảng dữ liệu (Loại hình, Dự án, Giá, Diện tích, SĐT, Lợi nhuận, Notice). "
+               f"Cột Thư mục ảnh (nếu có) là thư mục ảnh trên máy chủ, nằm trong {IMPORT_IMAGES_ROOT}/ "
+               "(và thư mục con bên dưới, nếu nhập).")
+    import_file = st.file_uploader("File danh sách nhà", type=["csv", "xlsx"], key="import_file")
+    images_root = st.text_input(f"Thư mục con trong {IMPORT_IMAGES_ROOT}/ chứa ảnh (tùy chọn)", key="import_images_root")
+    dry_run = st.checkbox("Chỉ kiểm tra, không nhập", key="import_dry_run")
+    if st.button("📥 Nhập dữ liệu", key="import_start", disabled=import_file is None or import_job.running):
+        # The file's folders are checked against this root too, so nothing outside it can be pulled in
+        root = bulk_import.resolve_inside(IMPORT_IMAGES_ROOT, images_root.strip())
+        if root is None:
+            st.error(f"❌ Thư mục ảnh phải nằm trong {IMPORT_IMAGES_ROOT}/.")
+        else:
+            import_job.start(bulk_import.import_listings, import_file, store, name=import_file.name,
+                             image_dir=IMAGE_DIR, images_root=root, dry_run=dry_run, thumbs=thumbs,
+                             thumb_widths=[IMAGE_WIDTH * s for s in THUMB_SCALES], manifest=manifest)
+
+    @st.fragment(run_every=1)
+    def import_status():
+        if import_job.running:
+            st.progress(import_job.progress, text=f"📥 Đang nhập... {import_job.message}")
+            return
+        if st.session_state.get("import_seen") == import_job.finished_at:
+            return
+        st.session_state.import_seen = import_job.finished_at
+        if import_job.state == "error":
+            st.session_state.import_message = ("error", f"❌ Lỗi khi nhập: {import_job.error}", None)
+        else:
+            report = import_job.result
+            message = (f"✅ {report['rows']} dòng: {report['imported']} "
+                       f"{'hợp lệ' if report['dry_run'] else 'đã nhập'}, {len(report['errors'])} lỗi, {report['images']} ảnh.")
+            if report["missing_folders"]:
+                message += f" ⚠️ {len(report['missing_folders'])} thư mục ảnh không tồn tại."
+            if report["outside_folders"]:
+                message += f" ⛔ {len(report['outside_folders'])} thư mục ảnh nằm ngoài {IMPORT_IMAGES_ROOT}/ bị bỏ qua."
+            errors = bulk_import.error_report(report["errors"]) if report["errors"] else None
+            st.session_state.import_message = ("success", message, errors)
+        st.rerun()
+
+    if import_job.running or (import_job.finished_at and st.session_state.get("import_seen") != import_job.finished_at):
+        import_status()
+    if "import_message" in st.session_state:
+        kind, message, errors = st.session_state.pop("import_message")
+        getattr(st, kind)(message)
+        if errors:
+            st.download_button("⬇️ Tải danh sách dòng lỗi", data=errors.encode("utf-8-sig"), file_name="dong_loi.csv",
+                               mime="text/csv", key="import_errors", on_click="ignore")
+
+prof.lap("add_form")
 
 # === Search & Display Houses ===
 st.header("🔍 Tìm kiếm nhà")
@@ -676,12 +794,12 @@ with col5:
     min_area = st.text_input("Diện tích từ (m²)", key="min_area")
 with col6:
     max_area = st.text_input("Diện tích đến (m²)", key="max_area")
+text_search = st.text_input("Tìm nhanh (Dự án, Loại hình, Ghi chú — không cần dấu, gõ sai vẫn tìm được)", key="search_text")
 
 if st.button("🔎 Tìm"):
     st.session_state.search_triggered = True
 
 def filter_data(df):
-    result = df.copy()
     try:
         min_p = float(min_price) if min_price else 0
         max_p = float(max_price) if max_price else float("inf")
@@ -694,122 +812,322 @@ def filter_data(df):
     except:
         st.error("❌ Diện tích không hợp lệ")
         return pd.DataFrame()
-    if loai_hinh_search:
-        result = result[result["Loại hình"].str.contains(loai_hinh_search, case=False, na=False)]
-    if du_an_search:
-        result = result[result["Dự án"].str.contains(du_an_search, case=False, na=False)]
-    result = result[(result["Giá"] >= min_p) & (result["Giá"] <= max_p)]
-    result = result[(result["Diện tích"] >= min_a) & (result["Diện tích"] <= max_a)]
-    return result
+    # The store applies the predicates itself (in SQL for the SQLite backend)
+    return store.search(loai_hinh_search, du_an_search, min_p, max_p, min_a, max_a)
+
+query_hits = store.queries.hits
+filtered = filter_data(df) if st.session_state.search_triggered else df
+if st.session_state.search_triggered and text_search.strip() and not filtered.empty:
+    # Best matches first, restricted to rows that pass the other filters
+    ranked = store.rank(text_search)
+    filtered = filtered.loc[ranked.intersection(filtered.index, sort=False)]
 
-filtered = filter_data(df) if st.session_state.search_triggered else df.copy()
+prof.count("query_cache_hits", store.queries.hits - query_hits)
+prof.lap("filter_data")
 
 st.header("📋 Danh sách nhà")
+thumb_misses = thumbs.misses
+p1, p2, p3 = st.columns([1, 1, 2])
+with p1:
+    page_size = st.selectbox("Số nhà mỗi trang", PAGE_SIZES, index=1, key="page_size")
+with p2:
+    load_more = st.checkbox("Tải thêm khi cuộn", key="load_more")
+
+# Back to the first page whenever the result set or the paging mode changes
+page_key = (st.session_state.search_triggered, loai_hinh_search, du_an_search, min_price, max_price,
+            min_area, max_area, text_search, page_size, load_more)
+if st.session_state.page_key != page_key:
+    st.session_state.page_key = page_key
+    st.session_state.page = 1
+
+total_pages = max(1, -(-len(filtered) // page_size))
+page = min(st.session_state.page, total_pages)
+if load_more:
+    start, end = 0, page * page_size
+else:
+    start, end = (page - 1) * page_size, page * page_size
+with p3:
+    st.caption(f"Hiển thị {min(start + 1, len(filtered))}–{min(end, len(filtered))} / {len(filtered)} nhà")
+
+# Only the visible slice is rendered, however many rows matched
+page_rows = filtered.iloc[start:end]
+
+# === Share packages ===
+# Built by the share worker; the session that clicked sees progress, then the result
+@st.fragment(run_every=1)
+def share_pending(listing_id):
+    if sharer.job(listing_id).done():
+        st.rerun()
+    st.info("⏳ Đang chuẩn bị ảnh để chia sẻ...")
+
+def share_status(listing_id):
+    job = sharer.job(listing_id)
+    if job is None:
+        return
+    if not job.done():
+        share_pending(listing_id)
+        return
+    if job.exception() is not None:
+        st.error(f"❌ Chia sẻ thất bại: {job.exception()}")
+        return
+    report = job.result()
+    st.success(f"✅ Đã chia sẻ tại: {report['dest']} ({report['files']} ảnh, {report['unchanged']} không đổi)")
+
+    def share_zip():
+        with open(sharer.zip(listing_id), "rb") as f:
+            return f.read()
+
+    st.download_button("🗜️ Tải gói ZIP", data=share_zip,
+                       file_name=os.path.basename(report["dest"]) + ".zip", mime="application/zip",
+                       key=f"share_zip_{listing_id}", on_click="ignore")
+
+st.session_state.setdefault("shared", set())
+
+def thumbnail_url(path):
+    return "app/static/" + os.path.relpath(path, "static").replace(os.sep, "/")
+
+def show_thumbnails(folder, images):
+    # Plain <img> tags pointing at the static files: nothing is read or encoded server-side
+    tags = []
+    for image in images:
+        path = os.path.join(folder, image["name"])
+        sources = [(thumbs.get(path, IMAGE_WIDTH * s, image["mtime_ns"]), s) for s in THUMB_SCALES]
+        sources = [(thumbnail_url(p), s) for p, s in sources if p]
+        if sources:
+            srcset = ", ".join(f"{url} {s}x" for url, s in sources)
+            tags.append(f'<img src="{sources[0][0]}" srcset="{srcset}" width="{IMAGE_WIDTH}" loading="lazy" '
+                        f'alt="{escape(os.path.basename(path))}" style="margin:0 4px 4px 0">')
+    if tags:
+        st.markdown("".join(tags), unsafe_allow_html=True)
+
 if filtered.empty:
     st.warning("Không tìm thấy kết quả.")
 else:
-    for idx, row in filtered.iterrows():
+    # Photos of the whole page in one manifest query, no directory listing
+    page_images = manifest.images_many(listing_folders(page_rows))
+    for idx, row in page_rows.iterrows():
         st.markdown("---")
         c1, c2 = st.columns([1, 2])
         with c1:
             folder_path = row["Thư mục ảnh"]
-            if os.path.exists(folder_path):
-                images = [Image.open(os.path.join(folder_path, f)) for f in os.listdir(folder_path) if f.lower().endswith(('png', 'jpg', 'jpeg'))]
-                st.image(images, width=IMAGE_WIDTH)
+            listing_images = page_images[idx]
+            # Only pre-scaled thumbnails are shown; originals are never decoded here
+            if STATIC_SERVING:
+                show_thumbnails(folder_path, listing_images)
+            else:
+                # Thumbnails at exactly IMAGE_WIDTH go out as stored, with no resize/re-encode
+                images = [thumbs.get(os.path.join(folder_path, image["name"]), IMAGE_WIDTH, image["mtime_ns"])
+                          for image in listing_images]
+                images = [path for path in images if path]
+                if prof.enabled:
+                    prof.count("image_bytes_sent", sum(os.path.getsize(path) for path in images))
+                if images:
+                    st.image(images, width=IMAGE_WIDTH)
         with c2:
             st.markdown(f"""
             **🏠 Loại hình:** {row['Loại hình']}  
             **📦 Dự án:** {row['Dự án']}  
-            **💰 Giá:** {row['Giá']}  
-            **📐 Diện tích:** {row['Diện tích']} m²  
+            **💰 Giá:** {format_number(row['Giá'])}  
+            **📐 Diện tích:** {format_number(row['Diện tích'], 'Diện tích')} m²  
             **📞 SĐT:** {row['SĐT']}  
-            **📈 Lợi nhuận:** {row['Lợi nhuận']}  
+            **📈 Lợi nhuận:** {format_number(row['Lợi nhuận'])}  
             **📝 Ghi chú:** {row['Notice']}
             """)
             b1, b2, b3 = st.columns(3)
             with b1:
                 if st.button("📤 Chia sẻ", key=f"share_{idx}"):
-                    share_folder = os.path.join(SHARED_DIR, f"{row['Loại hình']}_{idx}")
-                    os.makedirs(share_folder, exist_ok=True)
-                    with open(os.path.join(share_folder, "thong_tin.txt"), "w", encoding="utf-8") as f:
-                        f.write(
-                            f"🏠 Loại hình: {row['Loại hình']}\n"
-                            f"📦 Dự án: {row['Dự án']}\n"
-                            f"💰 Giá: {row['Giá']}\n"
-                            f"📐 Diện tích: {row['Diện tích']} m²\n"
-                            f"📝 Ghi chú: {row['Notice']}"
-                        )
-                    for f in os.listdir(folder_path):
-                        shutil.copy(os.path.join(folder_path, f), share_folder)
-                    st.success(f"✅ Đã chia sẻ tại: {share_folder}")
+                    sharer.submit(idx, folder_path, f"{row['Loại hình']}_{idx}",
+                                  f"🏠 Loại hình: {row['Loại hình']}\n"
+                                  f"📦 Dự án: {row['Dự án']}\n"
+                                  f"💰 Giá: {format_number(row['Giá'])}\n"
+                                  f"📐 Diện tích: {format_number(row['Diện tích'], 'Diện tích')} m²\n"
+                                  f"📝 Ghi chú: {row['Notice']}",
+                                  images=[os.path.join(folder_path, image["name"]) for image in listing_images])
+                    st.session_state.shared.add(idx)
             with b2:
                 if st.button("🗑️ Xóa", key=f"del_{idx}"):
-                    shutil.rmtree(folder_path)
-                    df.drop(idx, inplace=True)
-                    df.reset_index(drop=True, inplace=True)
-                    save_data()
+                    shutil.rmtree(folder_path, ignore_errors=True)
+                    store.delete(idx)
+                    manifest.remove(idx)
                     st.rerun()
             with b3:
                 if st.button("✏️ Chỉnh sửa", key=f"edit_{idx}"):
                     st.session_state.edit_index = idx
+                    st.session_state.edit_version = store.row_version(idx)
                     st.session_state.edit_trigger = True
                     st.rerun()
+            if idx in st.session_state.shared:
+                share_status(idx)
+
+    st.markdown("---")
+    if load_more:
+        if end < len(filtered) and st.button("⬇️ Tải thêm", key="more"):
+            st.session_state.page = page + 1
+            st.rerun()
+    else:
+        n1, n2, n3 = st.columns([1, 2, 1])
+        with n1:
+            if st.button("◀️ Trang trước", key="prev_page", disabled=page <= 1):
+                st.session_state.page = page - 1
+                st.rerun()
+        with n2:
+            goto = st.number_input(f"Trang (1–{total_pages})", min_value=1, max_value=total_pages,
+                                   value=page, step=1, key=f"goto_page_{page}")
+            if goto != page:
+                st.session_state.page = int(goto)
+                st.rerun()
+        with n3:
+            if st.button("Trang sau ▶️", key="next_page", disabled=page >= total_pages):
+                st.session_state.page = page + 1
+                st.rerun()
+
+prof.count("images_decoded", thumbs.misses - thumb_misses)
+prof.lap("listing")
+
+# === Market analytics ===
+# Aggregates are kept current by the store on every add/edit/delete; this only reads them
+with st.expander("📊 Thống kê thị trường"):
+    dimension = st.radio("Nhóm theo", analytics.DIMENSIONS, horizontal=True, key="analytics_dimension")
+    market = store.rollups().table(dimension)
+    if market.empty:
+        st.info("Chưa có dữ liệu.")
+    else:
+        top = market.head(20)
+        c1, c2 = st.columns(2)
+        with c1:
+            st.caption("Giá/m² trung bình")
+            st.bar_chart(top["Giá/m² TB"])
+        with c2:
+            st.caption("Số tin")
+            st.bar_chart(top["Số tin"])
+        st.dataframe(market.round(3))
+prof.lap("analytics")
 
 # === Restore from CSV + ZIP ===
 st.header("📥 Khôi phục dữ liệu từ bản sao lưu")
 csv_restore = st.file_uploader("Tải lên file CSV", type=["csv"], key="restore_csv")
 zip_restore = st.file_uploader("Tải lên file ZIP ảnh", type=["zip"], key="restore_zip")
 
-if st.button("♻️ Phục hồi dữ liệu"):
+@st.cache_resource
+def get_restore_job():
+    return backup.BackgroundJob("restore")
+
+restore_job = get_restore_job()
+st.session_state.setdefault("restore_seen", restore_job.finished_at)
+
+def restore_data(restored, zip_source, progress=None):
+    # Images are extracted and swapped in first; the CSV only replaces the data once that succeeded
+    report = backup.restore_archive(zip_source, IMAGE_DIR, restored, progress=progress)
+    store.replace(report.pop("df"))
+    manifest.rescan(listing_folders(store.load()))
+    return report
+
+if st.button("♻️ Phục hồi dữ liệu", disabled=restore_job.running):
     if csv_restore and zip_restore:
         try:
-            df = pd.read_csv(csv_restore)
-            save_data()
-            shutil.rmtree(IMAGE_DIR)
-            os.makedirs(IMAGE_DIR, exist_ok=True)
-            zip_file = zipfile.ZipFile(zip_restore)
-            zip_file.extractall(IMAGE_DIR)
-            st.success("✅ Phục hồi thành công!")
-            st.rerun()
+            restore_job.start(restore_data, read_csv(csv_restore), zip_restore)
         except Exception as e:
             st.error(f"❌ Lỗi khi phục hồi: {e}")
     else:
         st.warning("⚠️ Cần cả file CSV và ZIP ảnh để phục hồi.")
 
+@st.fragment(run_every=1)
+def restore_status():
+    if restore_job.running:
+        st.progress(restore_job.progress, text=f"♻️ Đang phục hồi... {restore_job.progress:.0%}")
+        return
+    if st.session_state.get("restore_seen") == restore_job.finished_at:
+        return
+    st.session_state.restore_seen = restore_job.finished_at
+    if restore_job.state == "error":
+        st.session_state.restore_message = ("error", f"❌ Lỗi khi phục hồi: {restore_job.error}")
+    else:
+        report = restore_job.result
+        message = (f"✅ Phục hồi thành công! {report['files']} ảnh "
+                   f"({report['extracted']} giải nén, {report['unchanged']} giữ nguyên).")
+        if report["missing_folders"]:
+            message += f" ⚠️ {len(report['missing_folders'])} thư mục ảnh không có trong ZIP: " + \
+                       ", ".join(report["missing_folders"][:10])
+        st.session_state.restore_message = ("success", message)
+    st.rerun()
+
+if restore_job.running or (restore_job.finished_at and st.session_state.get("restore_seen") != restore_job.finished_at):
+    restore_status()
+if "restore_message" in st.session_state:
+    kind, message = st.session_state.pop("restore_message")
+    (st.error if kind == "error" else st.success)(message)
+
+# === Restore an incremental snapshot ===
+snapshots = backup.SnapshotStore(BACKUP_DIR).generations() if BACKUP_MODE == "incremental" else []
+if snapshots:
+    generation = st.selectbox("Hoặc chọn bản sao lưu", snapshots[::-1], key="restore_generation")
+    if st.button("⏪ Phục hồi bản này"):
+        try:
+            csv_snapshot = backup.SnapshotStore(BACKUP_DIR).restore(generation, IMAGE_DIR)
+            df = read_csv(csv_snapshot)
+            save_data()
+            manifest.rescan(listing_folders(store.load()))
+            st.success(f"✅ Đã phục hồi bản {generation}!")
+            st.rerun()
+        except Exception as e:
+            st.error(f"❌ Lỗi khi phục hồi: {e}")
+
+prof.lap("restore")
+
 # === Download Section ===
+# Nothing is built on a normal rerun: the callables run only when a download button is clicked,
+# and the results are reused until the data changes.
+@st.cache_resource
+def get_exports():
+    return backup.ExportCache(EXPORT_DIR)
+
+exports = get_exports()
+
 st.header("💽 Tải xuống dữ liệu")
-csv_export = df.to_csv(index=False).encode("utf-8-sig")
-st.download_button("⬇️ Tải xuống CSV", data=csv_export, file_name="du_lieu_bat_dong_san.csv", mime="text/csv")
+st.download_button("⬇️ Tải xuống CSV", data=lambda: exports.csv(store.load(), store.version),
+                   file_name="du_lieu_bat_dong_san.csv", mime="text/csv", on_click="ignore")
 
 def zip_all_images():
-    buf = io.BytesIO()
-    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
-        for folder, _, files in os.walk(IMAGE_DIR):
-            for f in files:
-                path = os.path.join(folder, f)
-                arcname = os.path.relpath(path, IMAGE_DIR)
-                z.write(path, arcname)
-    buf.seek(0)
-    return buf
+    # Built as a file on disk, then read back with the handle closed
+    with open(exports.images_zip(IMAGE_DIR), "rb") as f:
+        return f.read()
 
 if os.listdir(IMAGE_DIR):
-    image_zip = zip_all_images()
-    st.download_button("🖼️ Tải xuống ảnh", data=image_zip, file_name="anh_nha.zip", mime="application/zip")
+    st.download_button("🖼️ Tải xuống ảnh", data=zip_all_images, file_name="anh_nha.zip", mime="application/zip",
+                       on_click="ignore")
 
+# Photos changed on disk outside the app (copied in, deleted by hand) show up after a rescan;
+# same as `python manifest.py`
+if st.button("🔄 Quét lại thư mục ảnh"):
+    with st.spinner("Đang quét thư mục ảnh..."):
+        report = manifest.rescan(listing_folders(store.load()))
+    st.success(f"✅ {report['listings']} tin, {report['images']} ảnh, {report['changed']} tin thay đổi.")
+
+
+prof.lap("exports")
 
 # === Edit Form ===
 if st.session_state.edit_trigger and st.session_state.edit_index is not None:
     st.header("✏️ Chỉnh sửa thông tin nhà")
     edit_idx = st.session_state.edit_index
+    if edit_idx not in df.index:
+        # Deleted (possibly from another session) since the edit was opened
+        st.session_state.edit_trigger = False
+        st.session_state.edit_index = None
+        st.rerun()
     edit_row = df.loc[edit_idx]
+    if st.session_state.edit_conflict:
+        st.session_state.edit_conflict = False
+        st.warning("⚠️ Nhà này vừa được chỉnh sửa ở phiên khác. Form đã được tải lại với thông tin mới nhất, "
+                   "vui lòng kiểm tra và lưu lại.")
 
     with st.form("edit_form"):
         col1, col2 = st.columns(2)
         with col1:
             new_loai_hinh = st.text_input("Loại hình", value=edit_row["Loại hình"])
-            new_price = st.text_input("Giá", value=str(edit_row["Giá"]))
-            new_profit = st.text_input("Lợi nhuận", value=edit_row["Lợi nhuận"])
-            new_area = st.text_input("Diện tích (m²)", value=str(edit_row["Diện tích"]))
+            new_price = st.text_input("Giá", value=format_number(edit_row["Giá"]))
+            new_profit = st.text_input("Lợi nhuận", value=format_number(edit_row["Lợi nhuận"]))
+            new_area = st.text_input("Diện tích (m²)", value=format_number(edit_row["Diện tích"], "Diện tích"))
         with col2:
             new_du_an = st.text_input("Dự án", value=edit_row["Dự án"])
             new_phone = st.text_input("SĐT", value=edit_row["SĐT"])
@@ -818,7 +1136,7 @@ if st.session_state.edit_trigger and st.session_state.edit_index is not None:
         uploaded_edit_files = st.file_uploader(
             "Upload ảnh mới (nếu muốn ghi đè)",
             accept_multiple_files=True,
-            type=['png', 'jpg', 'jpeg', 'tif'],
+            type=['png', 'jpg', 'jpeg', 'webp', 'tif'],
             key=f"edit_uploader_{edit_idx}"
         )
 
@@ -826,31 +1144,53 @@ if st.session_state.edit_trigger and st.session_state.edit_index is not None:
 
         if submitted_edit:
             try:
-                new_price_val = float(new_price)
-                new_area_val = float(new_area)
                 # Update info
-                df.at[edit_idx, "Loại hình"] = new_loai_hinh
-                df.at[edit_idx, "Dự án"] = new_du_an
-                df.at[edit_idx, "Giá"] = new_price_val
-                df.at[edit_idx, "Diện tích"] = new_area_val
-                df.at[edit_idx, "SĐT"] = new_phone
-                df.at[edit_idx, "Lợi nhuận"] = new_profit
-                df.at[edit_idx, "Notice"] = new_notice
+                store.update(edit_idx, validate_listing({
+                    "Loại hình": new_loai_hinh,
+                    "Dự án": new_du_an,
+                    "Giá": new_price,
+                    "Diện tích": new_area,
+                    "SĐT": new_phone,
+                    "Lợi nhuận": new_profit,
+                    "Notice": new_notice
+                }), expected_version=st.session_state.edit_version)
 
                 # Handle image replacement
                 edit_folder_path = df.at[edit_idx, "Thư mục ảnh"]
                 if uploaded_edit_files:
+                    os.makedirs(edit_folder_path, exist_ok=True)
                     for f in os.listdir(edit_folder_path):
                         os.remove(os.path.join(edit_folder_path, f))
-                    for uploaded_file in uploaded_edit_files:
-                        with open(os.path.join(edit_folder_path, uploaded_file.name), "wb") as f:
-                            f.write(uploaded_file.read())
+                    _, rejected = ingest_uploads(uploaded_edit_files, edit_folder_path, thumbs,
+                                                 [IMAGE_WIDTH * s for s in THUMB_SCALES])
+                    manifest.scan(edit_idx, edit_folder_path)
+                    for name, err in rejected.items():
+                        st.toast(f"Bỏ qua {name}: không phải ảnh hợp lệ ({err})", icon="⚠️")
 
-                save_data()
                 st.success("✅ Đã cập nhật thành công!")
                 st.session_state.edit_trigger = False
                 st.session_state.edit_index = None
                 st.rerun()
 
-            except ValueError:
-                st.error("❌ Vui lòng nhập đúng định dạng Giá và Diện tích.")
+            except ValidationError as e:
+                st.error(f"❌ {e}")
+            except KeyError:
+                st.error("❌ Nhà này đã bị xóa.")
+            except ConflictError:
+                # Reopen the form on the current version instead of overwriting the other change
+                st.session_state.edit_version = store.row_version(edit_idx)
+                st.session_state.edit_conflict = True
+                st.rerun()
+
+# === Profiling panel ===
+if prof.enabled:
+    prof.lap("edit_form")
+    prof.finish()
+    caches = {"store": store.stats(), "thumbnails": thumbs.stats(), "manifest": manifest.stats(),
+              "queries": store.queries.stats()}
+    profiling.registry.dump(PROFILE_DUMP, extra={"caches": caches})
+    summary = profiling.registry.summary()
+    with st.expander(f"🛠️ Hiệu năng ({summary['runs']} lần chạy)"):
+        st.dataframe(pd.DataFrame(summary["stages"]).T.round(2))
+        st.json({"counters": summary["counters"], "caches": caches}, expanded=False)
+        st.caption(f"Đã ghi {PROFILE_DUMP}.json và {PROFILE_DUMP}.prom")
@@ -0,0 +1,489 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import traceback
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from storage import to_csv
+
+# Photos are already compressed: deflating them again costs CPU for ~0% gain
+STORED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.heic', '.zip')
+
+
+def compress_type_for(filename):
+    return zipfile.ZIP_STORED if filename.lower().endswith(STORED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+
+
+def walk_files(root):
+    for folder, _, files in os.walk(root):
+        for f in sorted(files):
+            path = os.path.join(folder, f)
+            yield path, os.path.relpath(path, root)
+
+
+# === Streaming ZIP ===
+# Files are streamed from disk into a temp file next to the destination, which is renamed
+# into place only once complete, so memory stays flat and a half-written archive never
+# appears under the final name.
+def write_zip(src_dir, dest_path, progress=None):
+    files = [(path, arcname, os.path.getsize(path)) for path, arcname in walk_files(src_dir)]
+    total = sum(size for _, _, size in files) or 1
+    done = 0
+    tmp = dest_path + ".part"
+    try:
+        with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+            for path, arcname, size in files:
+                zf.write(path, arcname, compress_type=compress_type_for(path))
+                done += size
+                if progress:
+                    progress(done / total, arcname)
+        os.replace(tmp, dest_path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return dest_path
+
+
+def write_csv(df, dest_path):
+    tmp = dest_path + ".part"
+    to_csv(df, tmp)
+    os.replace(tmp, dest_path)
+    return dest_path
+
+
+def create_backup(df, backup_dir, image_dir, progress=None, today=None):
+    today = today or datetime.today()
+    stamp = today.strftime("%Y%m%d")
+    write_csv(df, os.path.join(backup_dir, stamp + "_backup.csv"))
+    return write_zip(image_dir, os.path.join(backup_dir, stamp + "_images.zip"), progress)
+
+
+# === Background job ===
+# Runs one task at a time on a daemon thread; the UI polls state/progress instead of waiting.
+class BackgroundJob:
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._thread = None
+        self.state = "idle"  # idle | running | done | error
+        self.progress = 0.0
+        self.message = ""
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, fn, *args, **kwargs):
+        with self._lock:
+            if self.running:
+                return False
+            self.state, self.progress, self.message, self.error, self.result = "running", 0.0, "", None, None
+            self.started_at, self.finished_at = time.time(), None
+            self._thread = threading.Thread(
+                target=self._run, args=(fn, args, kwargs), name=self.name, daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def _run(self, fn, args, kwargs):
+        try:
+            self.result = fn(*args, progress=self.report, **kwargs)
+            self.progress, self.state = 1.0, "done"
+        except Exception as e:
+            self.error = f"{e}"
+            self.message = traceback.format_exc(limit=3)
+            self.state = "error"
+        finally:
+            self.finished_at = time.time()
+
+    def report(self, fraction, message=""):
+        self.progress = min(max(fraction, 0.0), 1.0)
+        self.message = message
+
+    def wait(self, timeout=None):
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+
+# === Incremental snapshots ===
+# Content-addressed store under BACKUP_DIR/snapshots: every distinct file (and CSV version)
+# is kept once in objects/<sha256[:2]>/<sha256>, and each generation is a small JSON manifest
+# mapping relative paths to hashes. Files whose size and mtime match the previous manifest
+# are not even re-read, so a backup costs roughly the size of what changed.
+SNAPSHOT_DIR = "snapshots"
+CHUNK = 1024 * 1024
+
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class SnapshotStore:
+    def __init__(self, backup_dir):
+        self.root = os.path.join(backup_dir, SNAPSHOT_DIR)
+        self.objects = os.path.join(self.root, "objects")
+        self.manifests = os.path.join(self.root, "manifests")
+        os.makedirs(self.objects, exist_ok=True)
+        os.makedirs(self.manifests, exist_ok=True)
+
+    def object_path(self, digest):
+        return os.path.join(self.objects, digest[:2], digest)
+
+    def _put_file(self, path, digest):
+        dest = self.object_path(digest)
+        if os.path.exists(dest):
+            return False
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = dest + ".part"
+        shutil.copyfile(path, tmp)
+        os.replace(tmp, dest)
+        return True
+
+    def _put_bytes(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        dest = self.object_path(digest)
+        if not os.path.exists(dest):
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            with open(dest + ".part", "wb") as f:
+                f.write(data)
+            os.replace(dest + ".part", dest)
+        return digest
+
+    def generations(self):
+        return sorted(f[:-5] for f in os.listdir(self.manifests) if f.endswith(".json"))
+
+    def manifest(self, generation):
+        with open(os.path.join(self.manifests, generation + ".json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    def create(self, df, image_dir, progress=None, keep=None, now=None):
+        now = now or datetime.today()
+        generations = self.generations()
+        previous = self.manifest(generations[-1])["files"] if generations else {}
+        entries = []
+        for path, arcname in walk_files(image_dir):
+            st = os.stat(path)
+            entries.append((path, arcname.replace(os.sep, "/"), st.st_size, st.st_mtime_ns))
+        total = sum(e[2] for e in entries) or 1
+        done = stored = 0
+        files = {}
+        for path, arcname, size, mtime_ns in entries:
+            old = previous.get(arcname)
+            if old and old["size"] == size and old["mtime_ns"] == mtime_ns and os.path.exists(self.object_path(old["hash"])):
+                digest = old["hash"]
+            else:
+                digest = sha256_file(path)
+                stored += self._put_file(path, digest)
+            files[arcname] = {"hash": digest, "size": size, "mtime_ns": mtime_ns}
+            done += size
+            if progress:
+                progress(done / total, arcname)
+        csv_digest = self._put_bytes(to_csv(df).encode("utf-8"))
+        generation = now.strftime("%Y%m%d-%H%M%S")
+        manifest = {"created": now.isoformat(), "csv": csv_digest, "files": files, "new_objects": stored}
+        tmp = os.path.join(self.manifests, generation + ".json.part")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(self.manifests, generation + ".json"))
+        if keep:
+            self.prune(keep)
+        return generation
+
+    def restore(self, generation, image_dir):
+        # Rebuilds the image tree in a staging directory and swaps it in only when complete.
+        # Returns the path of the generation's CSV snapshot for the caller to load.
+        manifest = self.manifest(generation)
+        staging = image_dir.rstrip("/\\") + ".restore"
+        shutil.rmtree(staging, ignore_errors=True)
+        for arcname, entry in manifest["files"].items():
+            dest = os.path.join(staging, *arcname.split("/"))
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.copyfile(self.object_path(entry["hash"]), dest)
+        os.makedirs(staging, exist_ok=True)
+        old = image_dir.rstrip("/\\") + ".old"
+        shutil.rmtree(old, ignore_errors=True)
+        if os.path.exists(image_dir):
+            os.replace(image_dir, old)
+        os.replace(staging, image_dir)
+        shutil.rmtree(old, ignore_errors=True)
+        return self.object_path(manifest["csv"])
+
+    def prune(self, keep):
+        generations = self.generations()
+        for generation in generations[:-keep]:
+            os.remove(os.path.join(self.manifests, generation + ".json"))
+        # Drop objects no remaining generation refers to
+        live = set()
+        for generation in self.generations():
+            manifest = self.manifest(generation)
+            live.add(manifest["csv"])
+            live.update(entry["hash"] for entry in manifest["files"].values())
+        removed = 0
+        for prefix in os.listdir(self.objects):
+            folder = os.path.join(self.objects, prefix)
+            for name in os.listdir(folder):
+                if name not in live:
+                    os.remove(os.path.join(folder, name))
+                    removed += 1
+        return removed
+
+
+def create_incremental_backup(df, backup_dir, image_dir, progress=None, keep=None):
+    return SnapshotStore(backup_dir).create(df, image_dir, progress=progress, keep=keep)
+
+
+def last_backup_date(backup_dir):
+    # Newest full backup (YYYYMMDD_backup.csv) or snapshot generation (YYYYMMDD-HHMMSS.json)
+    dates = [f[:8] for f in os.listdir(backup_dir) if f.endswith("_backup.csv")]
+    manifests = os.path.join(backup_dir, SNAPSHOT_DIR, "manifests")
+    if os.path.isdir(manifests):
+        dates += [f[:8] for f in os.listdir(manifests) if f.endswith(".json")]
+    return datetime.strptime(max(dates), "%Y%m%d") if dates else None
+
+
+# === Scheduler ===
+# Decides when the next automatic backup is due without touching BACKUP_DIR on every rerun:
+# the last backup time lives in a marker file read once per process, a timer thread checks
+# it periodically, and a lease file makes sure only one process/thread runs the backup.
+MARKER = ".last_backup"
+LEASE = ".backup.lease"
+
+
+class BackupScheduler:
+    def __init__(self, backup_dir, job, task, interval=timedelta(days=3), check_every=3600, lease_seconds=6 * 3600):
+        self.backup_dir = backup_dir
+        self.job = job
+        self.task = task
+        self.interval = interval
+        self.check_every = check_every
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.last = self._read_marker()
+
+    def _marker_path(self):
+        return os.path.join(self.backup_dir, MARKER)
+
+    def _read_marker(self):
+        try:
+            with open(self._marker_path(), encoding="utf-8") as f:
+                return datetime.fromisoformat(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            # First run with a scheduler: fall back to the backups already on disk, once
+            last = last_backup_date(self.backup_dir)
+            if last:
+                self._write_marker(last)
+            return last
+
+    def _write_marker(self, when):
+        tmp = self._marker_path() + ".part"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(when.isoformat())
+        os.replace(tmp, self._marker_path())
+
+    def due(self, now=None):
+        now = now or datetime.today()
+        return self.last is None or now - self.last >= self.interval
+
+    def _acquire_lease(self):
+        # The lease is written in full to a temp file and then linked into place (which fails if
+        # one exists), so other processes never see it half-written and mistake it for stale
+        path = os.path.join(self.backup_dir, LEASE)
+        tmp = f"{path}.{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(f"{os.getpid()} {time.time() + self.lease_seconds}")
+        try:
+            for _ in range(2):
+                try:
+                    os.link(tmp, path)
+                    return True
+                except FileExistsError:
+                    pass
+                try:
+                    with open(path, encoding="utf-8") as f:
+                        expires = float(f.read().split()[1])
+                except FileNotFoundError:
+                    continue  # released in the meantime
+                except (OSError, ValueError, IndexError):
+                    expires = 0
+                if time.time() < expires:
+                    return False
+                try:
+                    os.remove(path)  # stale lease left by a crashed process
+                except FileNotFoundError:
+                    pass
+            return False
+        finally:
+            os.remove(tmp)
+
+    def _release_lease(self):
+        try:
+            os.remove(os.path.join(self.backup_dir, LEASE))
+        except FileNotFoundError:
+            pass
+
+    def tick(self, now=None):
+        # Returns True when a backup was run by this call
+        if not self.due(now):
+            return False
+        with self._lock:
+            if not self._acquire_lease():
+                return False
+            try:
+                self.last = self._read_marker()  # another process may have just finished one
+                if not self.due(now) or not self.job.start(self.task):
+                    return False
+                self.job.wait()
+                if self.job.state == "done":
+                    self.last = now or datetime.today()
+                    self._write_marker(self.last)
+                return True
+            finally:
+                self._release_lease()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception:
+                traceback.print_exc()
+            self._stop.wait(self.check_every)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="backup-scheduler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+# === Exports ===
+# Download files are produced only when a download is actually requested, and reused while
+# the data is unchanged: the CSV by store version, the image ZIP by a signature of the tree.
+class ExportCache:
+    def __init__(self, export_dir):
+        self.export_dir = export_dir
+        self._lock = threading.Lock()
+        self._csv = (None, None)
+        self._zip_signature = None
+        self.builds = 0
+        os.makedirs(export_dir, exist_ok=True)
+
+    def csv(self, df, version):
+        with self._lock:
+            if self._csv[0] != version:
+                self._csv = (version, to_csv(df).encode("utf-8-sig"))
+                self.builds += 1
+            return self._csv[1]
+
+    def images_zip(self, image_dir):
+        dest = os.path.join(self.export_dir, "anh_nha.zip")
+        signature = [(arcname, os.stat(path).st_size, os.stat(path).st_mtime_ns) for path, arcname in walk_files(image_dir)]
+        with self._lock:
+            if signature != self._zip_signature or not os.path.exists(dest):
+                write_zip(image_dir, dest)
+                self._zip_signature = signature
+                self.builds += 1
+        return dest
+
+
+# === Restore from ZIP ===
+# Extracts into a staging directory next to image_dir with a worker pool and swaps it in only
+# once every member has been written and CRC-checked, so a failure leaves the current images
+# untouched. Files already present with the same size and CRC are hard-linked from the
+# current tree instead of being decompressed again.
+def listing_folder(path, image_dir):
+    # "anh_nha\\Chung cư_0" (saved on Windows) or "anh_nha/Chung cư_0" -> "Chung cư_0"
+    parts = [p for p in str(path).replace("\\", "/").split("/") if p not in ("", ".")]
+    if parts and parts[0] == os.path.basename(image_dir.rstrip("/\\")):
+        parts = parts[1:]
+    return "/".join(parts)
+
+
+def _crc32(path):
+    crc = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK), b""):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def _restore_member(zf, info, staging, image_dir):
+    dest = os.path.join(staging, *info.filename.split("/"))
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    current = os.path.join(image_dir, *info.filename.split("/"))
+    if os.path.isfile(current) and os.path.getsize(current) == info.file_size and _crc32(current) == info.CRC:
+        try:
+            os.link(current, dest)
+        except OSError:
+            shutil.copyfile(current, dest)
+        return False
+    with zf.open(info) as src, open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst, CHUNK)  # ZipExtFile verifies the CRC at EOF
+    return True
+
+
+def restore_archive(zip_source, image_dir, df, progress=None, workers=4):
+    image_dir = image_dir.rstrip("/\\")
+    with zipfile.ZipFile(zip_source) as zf:
+        members = [i for i in zf.infolist() if not i.is_dir()]
+        for info in members:
+            name = info.filename
+            if name.startswith(("/", "\\")) or ".." in name.replace("\\", "/").split("/") or ":" in name:
+                raise ValueError(f"Đường dẫn không hợp lệ trong ZIP: {name}")
+        folders = {m.filename.rsplit("/", 1)[0] for m in members if "/" in m.filename}
+        df = df.copy()
+        rel = df["Thư mục ảnh"].map(lambda p: listing_folder(p, image_dir) if p else "")
+        missing = sorted({f for f in rel if f and f not in folders})
+        # Store folders in this platform's form so they resolve after the restore
+        df["Thư mục ảnh"] = [os.path.join(image_dir, *f.split("/")) if f else "" for f in rel]
+
+        staging = image_dir + ".staging"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        total = sum(i.file_size for i in members) or 1
+        done = extracted = 0
+        try:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="restore") as pool:
+                futures = [(pool.submit(_restore_member, zf, i, staging, image_dir), i) for i in members]
+                for future, info in futures:
+                    extracted += future.result()
+                    done += info.file_size
+                    if progress:
+                        progress(done / total, info.filename)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+    old = image_dir + ".old"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(image_dir):
+        os.replace(image_dir, old)
+    os.replace(staging, image_dir)
+    shutil.rmtree(old, ignore_errors=True)
+    return {
+        "df": df,
+        "files": len(members),
+        "extracted": extracted,
+        "unchanged": len(members) - extracted,
+        "missing_folders": missing,
+    }
@@ -0,0 +1,82 @@
+# Microbenchmark: filter_data() predicates via pandas scans vs the SearchIndex.
+# Usage: python benchmarks/bench_search.py [rows]
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from search import FuzzyIndex, SearchIndex, filter_frame  # noqa: E402
+from storage import apply_schema  # noqa: E402
+
+LOAI_HINH = ["Chung cư", "Nhà phố", "Biệt thự", "Đất nền", "Shophouse", "Căn hộ dịch vụ", "Nhà vườn"]
+DU_AN = ["Sun Group", "Vinhomes Ocean Park", "Ecopark", "Masteri Thảo Điền", "Sunshine City",
+         "The Manor", "Gamuda Gardens", "Times City", "Royal City", "Imperia Garden"]
+
+QUERIES = [
+    {},
+    {"loai_hinh": "chung"},
+    {"du_an": "sun"},
+    {"min_price": 5, "max_price": 10},
+    {"loai_hinh": "nhà", "min_area": 50, "max_area": 120},
+    {"du_an": "park", "min_price": 2, "max_price": 15, "min_area": 40, "max_area": 200},
+    {"loai_hinh": "x", "du_an": "zzz"},
+]
+
+FUZZY_QUERIES = ["chung cu", "sun grp", "vinhome ocen", "biet thu sunshine", "so do chinh chu"]
+NOTICES = ["Căn góc view hồ, sổ đỏ chính chủ", "Gần trường học, nội thất đầy đủ", "Cần bán gấp", ""]
+
+
+def make_frame(n, seed=0):
+    rng = np.random.default_rng(seed)
+    gia = np.round(rng.uniform(0.5, 30, n), 2)
+    gia[rng.random(n) < 0.01] = np.nan
+    return pd.DataFrame({
+        "Loại hình": rng.choice(LOAI_HINH, n).astype(object),
+        "Dự án": (rng.choice(DU_AN, n).astype(object) + " " + rng.integers(1, 50, n).astype(str)).astype(object),
+        "Giá": gia,
+        "Diện tích": np.round(rng.uniform(20, 300, n), 1),
+        "SĐT": "0900000000",
+        "Lợi nhuận": "",
+        "Notice": rng.choice(NOTICES, n).astype(object),
+        "Thư mục ảnh": "",
+    })
+
+
+def timeit(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    df = apply_schema(make_frame(n))
+    t0 = time.perf_counter()
+    index = SearchIndex(df)
+    print(f"rows={n}  index build: {(time.perf_counter() - t0) * 1000:.1f} ms")
+    print(f"{'query':<70} {'pandas ms':>10} {'index ms':>10} {'ids ms':>8} {'rows':>8}")
+    for q in QUERIES:
+        expected = filter_frame(df, **q)
+        got = index.search(df, **q)
+        assert expected.index.equals(got.index), q
+        t_old = timeit(lambda: filter_frame(df.copy(), **q))
+        t_new = timeit(lambda: index.search(df, **q))
+        t_ids = timeit(lambda: index.query(**q))
+        print(f"{str(q):<70} {t_old:>10.2f} {t_new:>10.2f} {t_ids:>8.2f} {len(got):>8}")
+
+    t0 = time.perf_counter()
+    fuzzy = FuzzyIndex(df)
+    print(f"\nfuzzy index build: {(time.perf_counter() - t0) * 1000:.1f} ms")
+    for text in FUZZY_QUERIES:
+        ids, _ = fuzzy.query(text)
+        print(f"{text!r:<70} {timeit(lambda: fuzzy.query(text)):>10.2f} ms {len(ids):>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+# Benchmark suite for the app's hot paths on synthetic data.
+#
+#   python benchmarks/run.py --rows 10000 --image-listings 200 --out results.json
+#   python benchmarks/run.py --rows 100000 --compare results.json
+#
+# Generates a du_lieu_bat_dong_san.csv and anh_nha tree of the requested size in a work
+# directory, times each code path (latency percentiles over --repeat runs, then one extra
+# run under tracemalloc for peak Python memory) and writes the results as JSON.
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import backup  # noqa: E402
+from bench_search import make_frame  # noqa: E402
+from search import QueryCache  # noqa: E402
+from storage import ListingStore, SQLiteListingStore, read_csv  # noqa: E402
+
+CSV_FILE = "du_lieu_bat_dong_san.csv"
+IMAGE_DIR = "anh_nha"
+QUERIES = [
+    {"loai_hinh": "chung"},
+    {"du_an": "sun", "min_price": 2, "max_price": 15},
+    {"min_area": 50, "max_area": 120},
+]
+
+
+# === Synthetic data ===
+def generate(workdir, rows, image_listings, images_per_listing, image_size, seed=0):
+    df = make_frame(rows, seed)
+    df["Thư mục ảnh"] = [os.path.join(IMAGE_DIR, f"{t}_{i}") for i, t in enumerate(df["Loại hình"])]
+    df.to_csv(os.path.join(workdir, CSV_FILE), index=False)
+    rng = np.random.default_rng(seed)
+    buf = io.BytesIO()
+    # One noisy photo-sized JPEG, written under different names: realistic size, cheap to generate
+    Image.fromarray(rng.integers(0, 255, (image_size[1], image_size[0], 3), dtype=np.uint8)).save(buf, "JPEG", quality=85)
+    photo = buf.getvalue()
+    for i in range(min(image_listings, rows)):
+        folder = os.path.join(workdir, df.at[i, "Thư mục ảnh"])
+        os.makedirs(folder, exist_ok=True)
+        for j in range(images_per_listing):
+            with open(os.path.join(folder, f"{j}.jpg"), "wb") as f:
+                f.write(photo)
+    return df
+
+
+# === Measurement ===
+def measure(fn, repeat, setup=None):
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    if setup:
+        setup()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    t = np.array(times)
+    return {
+        "n": len(times),
+        "mean_ms": float(t.mean()),
+        "min_ms": float(t.min()),
+        "p50_ms": float(np.percentile(t, 50)),
+        "p95_ms": float(np.percentile(t, 95)),
+        "p99_ms": float(np.percentile(t, 99)),
+        "max_ms": float(t.max()),
+        "peak_mem_bytes": int(peak),
+    }
+
+
+def bench_all(workdir, repeat, skip_app=False):
+    csv_path = os.path.join(workdir, CSV_FILE)
+    image_dir = os.path.join(workdir, IMAGE_DIR)
+    backup_dir = os.path.join(workdir, "backups")
+    os.makedirs(backup_dir, exist_ok=True)
+    results = {}
+
+    results["csv_parse"] = measure(lambda: read_csv(csv_path), repeat)
+    store = ListingStore(csv_path, compact_every=10 ** 9, query_cache_bytes=0)  # uncached query timings
+    results["csv_load_cold"] = measure(lambda: ListingStore(csv_path).load(), repeat)
+    ListingStore(csv_path, sidecar=True).load()  # writes the Arrow sidecar
+    results["sidecar_load_cold"] = measure(lambda: ListingStore(csv_path, sidecar=True).load(), repeat)
+    store.load()
+    results["csv_load_cached"] = measure(store.load, repeat)
+    df = store.load()
+
+    for i, q in enumerate(QUERIES):
+        store.search(**q)  # build the index outside the timing
+        results[f"filter_data[{i}]"] = measure(lambda: store.search(**q), repeat)
+    store._index = None
+    results["search_index_build"] = measure(lambda: store.search(**QUERIES[0]), 1, setup=lambda: setattr(store, "_index", None))
+    store.rank("chung cu")
+    results["fuzzy_rank"] = measure(lambda: store.rank("chung cu sun grp"), repeat)
+    cached = ListingStore(csv_path)
+    for i, q in enumerate(QUERIES):
+        cached.search(**q)
+        results[f"filter_data_cached[{i}]"] = measure(lambda: cached.search(**q), repeat)
+
+    row = df.iloc[0].to_dict()
+    results["save_data.append"] = measure(lambda: store.append(row), repeat)
+    results["save_data.update"] = measure(lambda: store.update(df.index[0], {"Notice": "x"}), repeat)
+    results["save_data.delete"] = measure(lambda: store.delete(store.load().index[-1]), repeat)
+    results["save_data.compact"] = measure(store.compact, max(1, repeat // 5))
+
+    db = SQLiteListingStore(os.path.join(workdir, "bench.db"), csv_path=csv_path, query_cache_bytes=0)
+    results["sqlite.load"] = measure(lambda: db._read(), max(1, repeat // 5))
+    results["sqlite.search"] = measure(lambda: db.search(**QUERIES[1]), repeat)
+    db.queries = QueryCache()
+    db.search(**QUERIES[1])
+    results["sqlite.search_cached"] = measure(lambda: db.search(**QUERIES[1]), repeat)
+
+    backup_repeat = max(1, repeat // 5)
+    results["create_backup.zip"] = measure(lambda: backup.create_backup(df, backup_dir, image_dir), backup_repeat)
+    results["create_backup.incremental"] = measure(
+        lambda: backup.create_incremental_backup(df, backup_dir, image_dir), backup_repeat
+    )
+    exports = backup.ExportCache(os.path.join(workdir, ".exports"))
+    results["zip_all_images"] = measure(
+        lambda: exports.images_zip(image_dir), backup_repeat, setup=lambda: setattr(exports, "_zip_signature", None)
+    )
+    archive = exports.images_zip(image_dir)
+    results["restore.unchanged"] = measure(lambda: backup.restore_archive(archive, image_dir, df), backup_repeat)
+
+    if not skip_app:
+        results.update(bench_app(workdir, repeat))
+    return results
+
+
+def bench_app(workdir, repeat):
+    # Full script reruns (including the listing render) through Streamlit's headless AppTest
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        return {}
+    shutil.copy(os.path.join(ROOT, "app.py"), os.path.join(workdir, "app.py"))
+    os.environ["BDS_AUTO_BACKUP_DAYS"] = "0"
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        at = AppTest.from_file(os.path.join(workdir, "app.py"), default_timeout=600)
+        at.run()
+        results = {"app_rerun": measure(at.run, repeat)}
+        at.checkbox(key="load_more").check()
+        results["app_rerun.search"] = measure(
+            lambda: (at.text_input(key="search_du_an").input("sun"), at.run()), repeat
+        )
+        return results
+    finally:
+        os.chdir(cwd)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, previous):
+    print(f"\n{'benchmark':<32} {'before p50':>12} {'after p50':>12} {'ratio':>8}")
+    for name, result in current["results"].items():
+        old = previous["results"].get(name)
+        if not old:
+            continue
+        ratio = result["p50_ms"] / old["p50_ms"] if old["p50_ms"] else float("nan")
+        flag = "  <-- slower" if ratio > 1.2 else ""
+        print(f"{name:<32} {old['p50_ms']:>12.2f} {result['p50_ms']:>12.2f} {ratio:>8.2f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the app's hot paths on synthetic data")
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--image-listings", type=int, default=100, help="listings that get an image folder")
+    parser.add_argument("--images-per-listing", type=int, default=5)
+    parser.add_argument("--image-size", type=int, nargs=2, default=[1600, 1200], metavar=("W", "H"))
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--workdir", help="keep the generated data here instead of a temp dir")
+    parser.add_argument("--skip-app", action="store_true", help="don't run the Streamlit script itself")
+    parser.add_argument("--out", help="write results JSON to this file")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bds_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        t0 = time.perf_counter()
+        generate(workdir, args.rows, args.image_listings, args.images_per_listing, tuple(args.image_size))
+        print(f"generated {args.rows} rows in {workdir} ({time.perf_counter() - t0:.1f}s)")
+        results = bench_all(workdir, args.repeat, args.skip_app)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "rows": args.rows,
+            "image_listings": args.image_listings,
+            "images_per_listing": args.images_per_listing,
+            "image_size": args.image_size,
+            "repeat": args.repeat,
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    print(f"\n{'benchmark':<32} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'peak MB':>10}")
+    for name, r in results.items():
+        print(f"{name:<32} {r['p50_ms']:>10.2f} {r['p95_ms']:>10.2f} {r['p99_ms']:>10.2f} {r['peak_mem_bytes'] / 2**20:>10.1f}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
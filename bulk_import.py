@@ -0,0 +1,196 @@
+# Bulk import of listings from a partner's CSV/XLSX file.
+#
+#   python bulk_import.py doi_tac.xlsx --report loi.csv
+#   python bulk_import.py doi_tac.csv --images-root /data/anh_doi_tac --dry-run
+#
+# The file needs the same column headers as the listings table (Loại hình, Dự án, Giá,
+# Diện tích, SĐT, Lợi nhuận, Notice; Giá and Diện tích are required). "Thư mục ảnh", if
+# present, names a folder of photos to attach, relative to --images-root (default: the
+# file's own directory); folders that resolve outside that root are refused.
+# Rows are read and validated a chunk at a time (vectorized), only the typed valid rows are
+# kept, photos are attached on a thread pool and the whole batch is committed in one write.
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from images import IMAGE_EXTENSIONS, ingest_uploads
+from manifest import MANIFEST_FILE, ImageManifest
+from storage import COLUMNS, ID_COLUMN, open_store, validate_frame
+
+CSV_FILE = "du_lieu_bat_dong_san.csv"
+IMAGE_DIR = "anh_nha"
+CHUNK_ROWS = 5000
+REQUIRED = ["Giá", "Diện tích"]
+
+
+# === Reading ===
+def read_chunks(source, name=None, chunk_rows=CHUNK_ROWS):
+    # Yields frames of text cells, indexed by data row number (0 = first row after the header)
+    name = str(name or getattr(source, "name", source))
+    if name.lower().endswith((".xlsx", ".xlsm")):
+        yield from _xlsx_chunks(source, chunk_rows)
+    else:
+        yield from pd.read_csv(source, dtype=str, keep_default_na=False, chunksize=chunk_rows, encoding="utf-8-sig")
+
+
+def _xlsx_chunks(source, chunk_rows):
+    from openpyxl import load_workbook  # only needed for spreadsheets
+
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = ["" if c is None else str(c).strip() for c in next(rows, ())]
+        batch, start = [], 0
+        for row in rows:
+            cells = ["" if v is None else str(v) for v in row[:len(header)]]
+            batch.append(cells + [""] * (len(header) - len(cells)))
+            if len(batch) == chunk_rows:
+                yield pd.DataFrame(batch, columns=header, index=range(start, start + len(batch)))
+                batch, start = [], start + len(batch)
+        if batch:
+            yield pd.DataFrame(batch, columns=header, index=range(start, start + len(batch)))
+    finally:
+        wb.close()
+
+
+# === Images ===
+def resolve_inside(root, path):
+    # root/path, or None when it points outside root (absolute path, "..", symlink)
+    root = os.path.realpath(root)
+    full = os.path.realpath(os.path.join(root, path))
+    return full if os.path.commonpath([root, full]) == root else None
+
+
+def attach_images(src_folder, dest_folder, thumbs=None, thumb_widths=()):
+    # Copies a folder of photos through the normal upload ingestion; returns (saved, rejected)
+    names = sorted(f for f in os.listdir(src_folder) if f.lower().endswith(IMAGE_EXTENSIONS))
+    files = [open(os.path.join(src_folder, f), "rb") for f in names]
+    try:
+        saved, rejected = ingest_uploads(files, dest_folder, thumbs, thumb_widths)
+    finally:
+        for f in files:
+            f.close()
+    return len(saved), len(rejected)
+
+
+# === Import ===
+def import_listings(source, store, name=None, image_dir=IMAGE_DIR, images_root=None, chunk_rows=CHUNK_ROWS,
+                    dry_run=False, thumbs=None, thumb_widths=(), workers=4, progress=None, manifest=None):
+    total_bytes = _size(source)
+    images_root = images_root or "."
+    batches, errors = [], []
+    report = {"rows": 0, "imported": 0, "images": 0, "rejected_images": 0, "missing_folders": [],
+              "outside_folders": [], "dry_run": dry_run}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="import") as pool:
+        for chunk in read_chunks(source, name, chunk_rows):
+            chunk.columns = [str(c).strip() for c in chunk.columns]
+            missing = [c for c in REQUIRED if c not in chunk.columns]
+            if missing:
+                raise ValueError(f"Thiếu cột: {', '.join(missing)}")
+            report["rows"] += len(chunk)
+            valid, bad = validate_frame(chunk[[c for c in chunk.columns if c in COLUMNS]])
+            errors.extend((int(i) + 2, message) for i, message in bad.items())  # +2: header, 1-based lines
+            if not dry_run and len(valid):
+                valid = _attach(valid, store.new_ids(len(valid)), pool, image_dir, images_root, thumbs,
+                                thumb_widths, report, manifest)
+            batches.append(valid)
+            if progress and total_bytes:
+                progress(min(_position(source) / total_bytes, 0.99), f"{report['rows']} dòng")
+    frame = pd.concat(batches) if batches else None
+    if frame is not None and len(frame) and not dry_run:
+        store.append_many(frame)
+    report["imported"] = 0 if frame is None else len(frame)
+    report["errors"] = errors
+    return report
+
+
+def _attach(valid, ids, pool, image_dir, images_root, thumbs, thumb_widths, report, manifest=None):
+    sources = valid["Thư mục ảnh"].astype(str).tolist()
+    valid.index = pd.Index(ids, name=ID_COLUMN)
+    folders = [os.path.join(image_dir, f"{t}_{i}") for t, i in zip(valid["Loại hình"].astype(str), ids)]
+    valid["Thư mục ảnh"] = folders
+    jobs = []
+    for listing_id, src, dest in zip(ids, sources, folders):
+        # Every listing gets its folder, so photos can be added later from the edit form
+        os.makedirs(dest, exist_ok=True)
+        if not src:
+            continue
+        resolved = resolve_inside(images_root, src)
+        if resolved is None:
+            report["outside_folders"].append(src)
+            continue
+        src = resolved
+        if not os.path.isdir(src):
+            report["missing_folders"].append(src)
+            continue
+        jobs.append((listing_id, dest, pool.submit(attach_images, src, dest, thumbs, thumb_widths)))
+    for _, _, job in jobs:
+        saved, rejected = job.result()
+        report["images"] += saved
+        report["rejected_images"] += rejected
+    if manifest is not None:
+        # Rows without photos are recorded as empty, so they are never scanned later
+        attached = {listing_id for listing_id, _, _ in jobs}
+        manifest.scan_many((listing_id, dest) for listing_id, dest, _ in jobs)
+        manifest.scan_many((i, f) for i, f in zip(ids, folders) if i not in attached)
+    return valid
+
+
+def _size(source):
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    return getattr(source, "size", None)
+
+
+def _position(source):
+    try:
+        return source.tell()
+    except (AttributeError, ValueError, OSError):
+        return 0
+
+
+def error_report(errors):
+    # Bad rows as CSV text: line number in the source file and the reason
+    return pd.DataFrame(errors, columns=["Dòng", "Lỗi"]).to_csv(index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import listings from a CSV/XLSX file")
+    parser.add_argument("file")
+    parser.add_argument("--csv", default=CSV_FILE, help="listings CSV of the app")
+    parser.add_argument("--backend", default=os.environ.get("BDS_STORAGE", "csv"), choices=["csv", "sqlite"])
+    parser.add_argument("--image-dir", default=IMAGE_DIR)
+    parser.add_argument("--images-root", help="base directory of the file's Thư mục ảnh column")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--manifest", default=MANIFEST_FILE, help="image manifest of the app")
+    parser.add_argument("--dry-run", action="store_true", help="validate only, import nothing")
+    parser.add_argument("--report", help="write the rejected rows to this CSV file")
+    args = parser.parse_args()
+
+    store = open_store(args.csv, args.backend)
+    manifest = ImageManifest(args.manifest)
+    images_root = args.images_root or os.path.dirname(os.path.abspath(args.file))
+    with open(args.file, "rb") as f:
+        report = import_listings(f, store, name=args.file, image_dir=args.image_dir, images_root=images_root,
+                                 chunk_rows=args.chunk_rows, dry_run=args.dry_run, manifest=manifest)
+    errors = report.pop("errors")
+    print(f"{report['rows']} dòng, {report['imported']} {'hợp lệ' if args.dry_run else 'đã nhập'}, "
+          f"{len(errors)} lỗi, {report['images']} ảnh ({report['rejected_images']} ảnh lỗi bị bỏ qua)")
+    for folder in report["missing_folders"]:
+        print(f"không tìm thấy thư mục ảnh: {folder}", file=sys.stderr)
+    for folder in report["outside_folders"]:
+        print(f"bỏ qua thư mục ảnh nằm ngoài --images-root: {folder}", file=sys.stderr)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8-sig", newline="") as f:
+            f.write(error_report(errors))
+    elif errors:
+        for line, message in errors[:20]:
+            print(f"dòng {line}: {message}", file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps, features
+
+IMAGE_EXTENSIONS = ('png', 'jpg', 'jpeg', 'webp')
+
+
+# === Thumbnail cache ===
+# Downscaled copies of listing photos kept on disk, keyed by source path + mtime + width,
+# so the listing view never decodes a full-resolution photo. Total size is capped and the
+# least recently used thumbnails are evicted first.
+class ThumbnailCache:
+    def __init__(self, cache_dir, max_bytes=200 * 1024 * 1024, quality=80):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self.format, self.ext = ("WEBP", ".webp") if features.check("webp") else ("JPEG", ".jpg")
+        self._lock = threading.Lock()
+        self._entries = None  # key -> size, oldest first
+        self._total = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _load_index(self):
+        # Rebuilt once per process from the files on disk, oldest first
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(self.ext):
+                continue
+            st = os.stat(os.path.join(self.cache_dir, name))
+            files.append((st.st_mtime, name[:-len(self.ext)], st.st_size))
+        files.sort()
+        self._entries = OrderedDict((key, size) for _, key, size in files)
+        self._total = sum(self._entries.values())
+
+    def key(self, src_path, width, mtime_ns=None):
+        # mtime_ns, when the caller already knows it (image manifest), saves the stat
+        if mtime_ns is None:
+            mtime_ns = os.stat(src_path).st_mtime_ns
+        raw = f"{os.path.abspath(src_path)}|{mtime_ns}|{width}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, key + self.ext)
+
+    def get(self, src_path, width, mtime_ns=None):
+        try:
+            key = self.key(src_path, width, mtime_ns)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if self._entries is None:
+                self._load_index()
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self.path_for(key)
+            self.misses += 1
+        size = self._render(src_path, key, width)
+        if size is None:
+            return None
+        with self._lock:
+            # Another session may have rendered the same key meanwhile: count the file once
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            else:
+                self._entries[key] = size
+                self._total += size
+                self._evict()
+        return self.path_for(key)
+
+    def warm(self, src_paths, widths):
+        for src in src_paths:
+            for width in widths:
+                self.get(src, width)
+
+    def _render(self, src_path, key, width):
+        dest = self.path_for(key)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")  # per call: renders of one key may race
+        os.close(fd)
+        try:
+            with Image.open(src_path) as img:
+                if img.format == "JPEG":
+                    img.draft("RGB", (width, width))
+                img = ImageOps.exif_transpose(img)
+                if img.mode not in ("RGB", "L"):
+                    img = img.convert("RGB")
+                if img.width > width:
+                    img = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+                img.save(tmp, self.format, quality=self.quality)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            os.remove(tmp)
+            return None
+        size = os.path.getsize(tmp)
+        os.replace(tmp, dest)
+        return size
+
+    def _evict(self):
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._total -= size
+            self.evictions += 1
+            try:
+                os.remove(self.path_for(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "files": len(self._entries or ()),
+            "bytes": self._total,
+        }
+
+
+def list_images(folder_path):
+    return [os.path.join(folder_path, f) for f in sorted(os.listdir(folder_path)) if f.lower().endswith(IMAGE_EXTENSIONS)]
+
+
+# === Upload ingestion ===
+# Each upload is streamed to disk in chunks, then checked and normalised on a worker thread
+# (Pillow releases the GIL while decoding/encoding): rejected if it isn't an image, rotated
+# upright, EXIF dropped, and re-encoded at most MAX_SIDE px on the long edge.
+MAX_SIDE = int(os.environ.get("BDS_IMAGE_MAX_SIDE", "2560"))
+JPEG_QUALITY = int(os.environ.get("BDS_IMAGE_QUALITY", "85"))
+CHUNK = 1024 * 1024
+_pool = ThreadPoolExecutor(max_workers=min(8, (os.cpu_count() or 2) + 2), thread_name_prefix="ingest")
+
+
+def _safe_name(name):
+    name = os.path.basename(name.replace("\\", "/")).strip()
+    return name or "anh"
+
+
+def _unique_names(uploads, folder_path):
+    # Phones name every photo image.jpg: each upload gets its own stem (image, image_1, ...),
+    # also distinct from files already in the folder, since the extension may change on re-encode
+    taken = {os.path.splitext(f)[0].lower() for f in os.listdir(folder_path)}
+    names = []
+    for upload in uploads:
+        base, ext = os.path.splitext(_safe_name(upload.name))
+        stem, n = base, 0
+        while stem.lower() in taken:
+            n += 1
+            stem = f"{base}_{n}"
+        taken.add(stem.lower())
+        names.append(stem + ext)
+    return names
+
+
+def _ingest_one(upload, name, folder_path, max_side, quality):
+    fd, tmp = tempfile.mkstemp(dir=folder_path, prefix=".", suffix=".upload")
+    upload.seek(0)
+    with os.fdopen(fd, "wb") as f:
+        shutil.copyfileobj(upload, f, CHUNK)
+    try:
+        with Image.open(tmp) as img:
+            img.verify()
+        with Image.open(tmp) as img:
+            fmt = img.format
+            needs_encode = (
+                fmt not in ("JPEG", "PNG", "WEBP")
+                or max(img.size) > max_side
+                or bool(img.getexif())
+            )
+        if not needs_encode:
+            # Renamed only once Pillow has closed it (Windows can't rename an open file)
+            dest = os.path.join(folder_path, name)
+            os.replace(tmp, dest)
+            return dest
+        with Image.open(tmp) as img:
+            if fmt == "JPEG":
+                img.draft("RGB", (max_side, max_side))  # let libjpeg decode at a reduced scale
+            img = ImageOps.exif_transpose(img)
+            if max(img.size) > max_side:
+                img.thumbnail((max_side, max_side), Image.LANCZOS)
+            base, _ = os.path.splitext(name)
+            if fmt == "PNG" or img.mode in ("RGBA", "LA", "P"):
+                dest = os.path.join(folder_path, base + ".png")
+                img.save(dest + ".part", "PNG", optimize=True)
+            else:
+                dest = os.path.join(folder_path, base + ".jpg")
+                img.convert("RGB").save(dest + ".part", "JPEG", quality=quality, optimize=True)
+        os.replace(dest + ".part", dest)
+        return dest
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def ingest_uploads(uploads, folder_path, thumbs=None, thumb_widths=(), max_side=MAX_SIDE, quality=JPEG_QUALITY):
+    # Returns (saved paths, {file name as saved: error}) once every upload has been processed
+    os.makedirs(folder_path, exist_ok=True)
+    uploads = list(uploads or [])
+    names = _unique_names(uploads, folder_path)
+    futures = {_pool.submit(_ingest_one, u, name, folder_path, max_side, quality): name
+               for u, name in zip(uploads, names)}
+    saved, errors = [], {}
+    for future, name in futures.items():
+        try:
+            path = future.result()
+        except (OSError, ValueError, SyntaxError, Image.DecompressionBombError) as e:
+            errors[name] = type(e).__name__
+            continue
+        saved.append(path)
+    if thumbs is not None and thumb_widths:
+        images = [p for p in saved if p.lower().endswith(IMAGE_EXTENSIONS)]
+        list(_pool.map(lambda p: thumbs.warm([p], thumb_widths), images))
+    return saved, errors
@@ -0,0 +1,189 @@
+# Per-listing image manifest.
+#
+#   python manifest.py                 # resync the manifest with every listing's folder
+#   python manifest.py --backend sqlite
+#
+# A small SQLite file records, for each listing ID, its photo folder and the photos in it:
+# name, size, mtime, sha256 and pixel size. The add, edit, delete, import and restore paths
+# keep it current, so the listing view and the share worker read one query instead of
+# listing a directory per listing. Thumbnail keys come from the recorded path and mtime,
+# without a stat. A folder the manifest has never seen is scanned once, on first use.
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+
+from PIL import Image
+
+from backup import sha256_file
+from images import IMAGE_EXTENSIONS
+from storage import open_store
+
+MANIFEST_FILE = "anh_nha_manifest.sqlite"
+CSV_FILE = "du_lieu_bat_dong_san.csv"
+FOLDER_COLUMN = "Thư mục ảnh"
+FIELDS = ["name", "size", "mtime_ns", "hash", "width", "height"]
+
+
+def _dimensions(path):
+    try:
+        with Image.open(path) as img:  # header only, no decode
+            return img.size
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None, None
+
+
+def scan_folder(folder, previous=None):
+    # Photos of a folder as manifest entries; files whose size and mtime match `previous`
+    # (name -> entry) are not re-read
+    previous = previous or {}
+    try:
+        names = sorted(f for f in os.listdir(folder) if f.lower().endswith(IMAGE_EXTENSIONS))
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+    images = []
+    for name in names:
+        path = os.path.join(folder, name)
+        st = os.stat(path)
+        old = previous.get(name)
+        if old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+            images.append(old)
+            continue
+        width, height = _dimensions(path)
+        images.append({"name": name, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": sha256_file(path),
+                       "width": width, "height": height})
+    return images
+
+
+class ImageManifest:
+    def __init__(self, db_path=MANIFEST_FILE):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self.scans = 0  # folders listed by this process
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS folders (listing_id INTEGER PRIMARY KEY, folder TEXT NOT NULL)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS images (listing_id INTEGER NOT NULL, name TEXT NOT NULL, size INTEGER, "
+                "mtime_ns INTEGER, hash TEXT, width INTEGER, height INTEGER, PRIMARY KEY (listing_id, name))"
+            )
+
+    def _read(self, ids):
+        # {id: (folder, [images])} for the ids the manifest knows
+        found = {}
+        ids = [int(i) for i in ids]
+        for start in range(0, len(ids), 500):  # stay under SQLite's bound-parameter limit
+            part = ids[start:start + 500]
+            marks = ", ".join("?" * len(part))
+            for listing_id, folder in self._conn.execute(
+                    f"SELECT listing_id, folder FROM folders WHERE listing_id IN ({marks})", part):
+                found[listing_id] = (folder, [])
+            for row in self._conn.execute(
+                    f"SELECT listing_id, {', '.join(FIELDS)} FROM images WHERE listing_id IN ({marks}) "
+                    "ORDER BY listing_id, name", part):
+                found[row[0]][1].append(dict(zip(FIELDS, row[1:])))
+        return found
+
+    def _write(self, entries):
+        # entries: [(id, folder, images)], replacing whatever was recorded for those ids
+        with self._conn:
+            for listing_id, folder, images in entries:
+                self._conn.execute("DELETE FROM images WHERE listing_id = ?", (listing_id,))
+                self._conn.execute("INSERT OR REPLACE INTO folders (listing_id, folder) VALUES (?, ?)",
+                                   (listing_id, folder))
+                self._conn.executemany(
+                    f"INSERT INTO images (listing_id, {', '.join(FIELDS)}) VALUES (?, {', '.join('?' * len(FIELDS))})",
+                    [(listing_id, *[image[f] for f in FIELDS]) for image in images],
+                )
+
+    def images_many(self, listings):
+        # listings: [(id, folder)] -> {id: [images]}; ids not yet in the manifest (or whose
+        # folder changed) are scanned now and recorded
+        listings = [(int(i), folder) for i, folder in listings]
+        with self._lock:
+            found = self._read([i for i, _ in listings])
+            missing = [(i, folder) for i, folder in listings if i not in found or found[i][0] != folder]
+            if missing:
+                found.update(self._scan(missing, found))
+            return {i: found[i][1] for i, _ in listings}
+
+    def images(self, listing_id, folder):
+        return self.images_many([(listing_id, folder)])[int(listing_id)]
+
+    def _scan(self, listings, known=None):
+        known = known or {}
+        entries = []
+        for listing_id, folder in listings:
+            old_folder, old_images = known.get(listing_id, (None, []))
+            previous = {image["name"]: image for image in old_images} if old_folder == folder else {}
+            self.scans += 1
+            entries.append((listing_id, folder, scan_folder(folder, previous)))
+        self._write(entries)
+        return {listing_id: (folder, images) for listing_id, folder, images in entries}
+
+    def scan(self, listing_id, folder):
+        # Called after a listing's photos were written
+        return self.scan_many([(listing_id, folder)])[int(listing_id)]
+
+    def scan_many(self, listings):
+        listings = [(int(i), folder) for i, folder in listings]
+        with self._lock:
+            found = self._scan(listings, self._read([i for i, _ in listings]))
+            return {i: images for i, (_, images) in found.items()}
+
+    def remove(self, listing_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM images WHERE listing_id = ?", (int(listing_id),))
+            self._conn.execute("DELETE FROM folders WHERE listing_id = ?", (int(listing_id),))
+
+    def rescan(self, listings, progress=None):
+        # Full resync with disk: every listing's folder is listed again (unchanged photos are
+        # not re-hashed) and entries of listings that no longer exist are dropped
+        listings = [(int(i), folder) for i, folder in listings]
+        report = {"listings": len(listings), "images": 0, "changed": 0, "removed": 0}
+        with self._lock:
+            ids = {i for i, _ in listings}
+            stale = [i for (i,) in self._conn.execute("SELECT listing_id FROM folders") if i not in ids]
+            for listing_id in stale:
+                self.remove(listing_id)
+            report["removed"] = len(stale)
+            for start in range(0, len(listings), 500):
+                part = listings[start:start + 500]
+                known = self._read([i for i, _ in part])
+                for listing_id, (folder, images) in self._scan(part, known).items():
+                    report["images"] += len(images)
+                    if known.get(listing_id) != (folder, images):
+                        report["changed"] += 1
+                if progress:
+                    progress(min(start + 500, len(listings)) / len(listings), f"{start + len(part)} tin")
+        return report
+
+    def stats(self):
+        with self._lock:
+            listings, images = self._conn.execute(
+                "SELECT (SELECT COUNT(*) FROM folders), (SELECT COUNT(*) FROM images)").fetchone()
+        return {"listings": listings, "images": images, "scans": self.scans}
+
+
+def listing_folders(df):
+    return list(zip(df.index, df[FOLDER_COLUMN].astype(str)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resync the image manifest with the photo folders on disk")
+    parser.add_argument("--csv", default=CSV_FILE, help="listings CSV of the app")
+    parser.add_argument("--backend", default=os.environ.get("BDS_STORAGE", "csv"), choices=["csv", "sqlite"])
+    parser.add_argument("--manifest", default=MANIFEST_FILE)
+    args = parser.parse_args()
+
+    store = open_store(args.csv, args.backend)
+    report = ImageManifest(args.manifest).rescan(listing_folders(store.load()))
+    print(f"{report['listings']} tin, {report['images']} ảnh, {report['changed']} tin thay đổi, "
+          f"{report['removed']} tin đã xóa khỏi manifest")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+
+# === Rerun profiler ===
+# Opt-in (BDS_PROFILE=1 or ?profile=1). Each rerun gets a RunProfiler that times named
+# stages as laps between markers placed through the script and counts events; finished
+# runs are folded into the process-wide Registry, which keeps a rolling window of samples
+# and cumulative histograms per stage for the debug panel and the JSON/Prometheus dumps.
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+WINDOW = 500
+
+
+class Registry:
+    def __init__(self, window=WINDOW):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(lambda: deque(maxlen=window))
+        self.buckets = defaultdict(lambda: [0] * (len(BUCKETS_MS) + 1))
+        self.sums = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.runs = 0
+
+    def record(self, timings, counters):
+        with self._lock:
+            self.runs += 1
+            for stage, ms in timings.items():
+                self.samples[stage].append(ms)
+                self.buckets[stage][int(np.searchsorted(BUCKETS_MS, ms))] += 1
+                self.sums[stage] += ms
+                self.counts[stage] += 1
+            for name, n in counters.items():
+                self.counters[name] += n
+
+    def summary(self):
+        with self._lock:
+            stages = {}
+            for stage, samples in self.samples.items():
+                s = np.fromiter(samples, float)
+                stages[stage] = {
+                    "last_ms": float(s[-1]),
+                    "p50_ms": float(np.percentile(s, 50)),
+                    "p95_ms": float(np.percentile(s, 95)),
+                    "max_ms": float(s.max()),
+                    "count": self.counts[stage],
+                    "sum_ms": self.sums[stage],
+                }
+            return {"runs": self.runs, "stages": stages, "counters": dict(self.counters)}
+
+    def prometheus_text(self):
+        lines = [
+            "# HELP bds_stage_duration_ms Time spent in each stage of the script per rerun.",
+            "# TYPE bds_stage_duration_ms histogram",
+        ]
+        with self._lock:
+            for stage, counts in sorted(self.buckets.items()):
+                cumulative = 0
+                for bound, n in zip(BUCKETS_MS + ("+Inf",), counts):
+                    cumulative += n
+                    lines.append(f'bds_stage_duration_ms_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'bds_stage_duration_ms_sum{{stage="{stage}"}} {self.sums[stage]:.3f}')
+                lines.append(f'bds_stage_duration_ms_count{{stage="{stage}"}} {self.counts[stage]}')
+            lines.append("# TYPE bds_events_total counter")
+            for name, n in sorted(self.counters.items()):
+                lines.append(f'bds_events_total{{event="{name}"}} {n}')
+            lines.append("# TYPE bds_reruns_total counter")
+            lines.append(f"bds_reruns_total {self.runs}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path, extra=None):
+        # Writes <path>.json and <path>.prom, each through a temp file
+        data = self.summary()
+        if extra:
+            data.update(extra)
+        for suffix, text in ((".json", json.dumps(data, indent=2, default=str)), (".prom", self.prometheus_text())):
+            tmp = path + suffix + ".part"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, path + suffix)
+
+
+registry = Registry()
+
+
+class RunProfiler:
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.timings = {}
+        self.counters = defaultdict(int)
+        self.finished = False
+        self._start = self._last = time.perf_counter()
+
+    def lap(self, stage):
+        # Attributes the time since the previous lap (or the start of the run) to `stage`
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.timings[stage] = self.timings.get(stage, 0.0) + (now - self._last) * 1000
+        self._last = now
+
+    def count(self, name, n=1):
+        if self.enabled and n:
+            self.counters[name] += n
+
+    def finish(self, stage=None):
+        # `stage` takes the time since the last lap: a run cut short by st.rerun() is finished
+        # by the next run, which starts right after it
+        if not self.enabled or self.finished:
+            return
+        if stage:
+            self.lap(stage)
+        self.finished = True
+        self.timings["total"] = (time.perf_counter() - self._start) * 1000
+        registry.record(self.timings, self.counters)
@@ -0,0 +1,308 @@
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+REGEX_CHARS = set(".^$*+?{}[]\\|()")
+TEXT_FIELDS = ["Loại hình", "Dự án"]
+RANGE_FIELDS = ["Giá", "Diện tích"]
+TRIGRAM_MIN_VALUES = 256  # below this many distinct values a plain scan of them is cheaper
+
+
+# === Reference filter ===
+# The original filter_data() predicates, kept as the definition the index has to match.
+def filter_frame(df, loai_hinh="", du_an="", min_price=0, max_price=float("inf"), min_area=0, max_area=float("inf")):
+    result = df
+    if loai_hinh:
+        result = result[result["Loại hình"].str.contains(loai_hinh, case=False, na=False)]
+    if du_an:
+        result = result[result["Dự án"].str.contains(du_an, case=False, na=False)]
+    result = result[(result["Giá"] >= min_price) & (result["Giá"] <= max_price)]
+    result = result[(result["Diện tích"] >= min_area) & (result["Diện tích"] <= max_area)]
+    return result
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+# === Text column index ===
+# Listing text columns have few distinct values, so each column is dictionary-encoded once:
+# a query is matched against the distinct values (narrowed by a trigram index when there
+# are many) and the matching codes are expanded to row ids through posting lists.
+class TextColumnIndex:
+    def __init__(self, values):
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Already dictionary-encoded by the schema
+            codes, uniques = values.cat.codes.to_numpy(), values.cat.categories.to_numpy(dtype=object)
+        else:
+            codes, uniques = pd.factorize(pd.Series(values, dtype=object).fillna(""), sort=False)
+        self.uniques = pd.Series(uniques, dtype=object)
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        self._postings = [order[bounds[i]:bounds[i + 1]] for i in range(len(uniques))]
+        self._grams = None
+        if len(uniques) >= TRIGRAM_MIN_VALUES:
+            self._grams = {}
+            for i, value in enumerate(self.uniques):
+                for gram in trigrams(str(value).lower()):
+                    self._grams.setdefault(gram, []).append(i)
+            self._grams = {g: np.asarray(ids) for g, ids in self._grams.items()}
+
+    def _candidates(self, term):
+        if self._grams is None or len(term) < 3 or not term.isascii() or REGEX_CHARS & set(term):
+            return np.arange(len(self.uniques))
+        ids = None
+        for gram in trigrams(term.lower()):
+            posting = self._grams.get(gram)
+            if posting is None:
+                return np.empty(0, dtype=np.int64)
+            ids = posting if ids is None else np.intersect1d(ids, posting, assume_unique=True)
+        return ids
+
+    def match(self, term):
+        candidates = self._candidates(term)
+        if len(candidates) == 0:
+            return np.empty(0, dtype=np.int64)
+        # Same predicate as the reference filter, evaluated on distinct values only
+        hits = self.uniques.iloc[candidates].str.contains(term, case=False, na=False).to_numpy()
+        matched = candidates[hits]
+        if len(matched) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate([self._postings[i] for i in matched]))
+
+
+# === Numeric range index ===
+class RangeIndex:
+    def __init__(self, values):
+        values = np.asarray(values)
+        if values.dtype.kind != "f":
+            values = values.astype("float64")
+        valid = np.flatnonzero(~np.isnan(values))  # NaN never satisfies a range, as with >=/<=
+        order = np.argsort(values[valid], kind="stable")
+        self.sorted_values = values[valid][order]
+        self.row_ids = valid[order]
+
+    def between(self, low, high):
+        # Bounds are compared in the column's own precision (float32 for Diện tích), as pandas does
+        cast = self.sorted_values.dtype.type
+        lo = np.searchsorted(self.sorted_values, cast(low), side="left")
+        hi = np.searchsorted(self.sorted_values, cast(high), side="right")
+        if lo == 0 and hi == len(self.sorted_values):
+            return None  # the range doesn't narrow anything
+        return np.sort(self.row_ids[lo:hi])
+
+
+# === Search index ===
+# Built once per data version and answers filter_frame() queries as positional row ids by
+# intersecting the per-predicate id sets, without copying the frame.
+class SearchIndex:
+    def __init__(self, df, version=None):
+        self.version = version
+        self.size = len(df)
+        self.text = {c: TextColumnIndex(df[c]) for c in TEXT_FIELDS}
+        self.ranges = {c: RangeIndex(df[c].to_numpy()) for c in RANGE_FIELDS}
+        self.valid = np.intersect1d(*(np.sort(r.row_ids) for r in self.ranges.values()), assume_unique=True)
+
+    def query(self, loai_hinh="", du_an="", min_price=0, max_price=float("inf"), min_area=0, max_area=float("inf")):
+        sets = []
+        for field, term in (("Loại hình", loai_hinh), ("Dự án", du_an)):
+            if term:
+                sets.append(self.text[field].match(term))
+        unbounded = False
+        for field, low, high in (("Giá", min_price, max_price), ("Diện tích", min_area, max_area)):
+            ids = self.ranges[field].between(low, high)
+            if ids is None:
+                unbounded = True
+            else:
+                sets.append(ids)
+        if unbounded:
+            # An open range still drops rows whose value is NaN, like the >=/<= comparisons do
+            sets.append(self.valid)
+        sets.sort(key=len)
+        result = sets[0]
+        for ids in sets[1:]:
+            if len(result) == 0:
+                break
+            result = np.intersect1d(result, ids, assume_unique=True)
+        return result
+
+    def search(self, df, *args, **kwargs):
+        return df.iloc[self.query(*args, **kwargs)]
+
+
+# === Fuzzy text search ===
+# Accent-insensitive, typo-tolerant ranked search over Dự án, Loại hình and Notice. Text is
+# folded (lowercase, Vietnamese diacritics and đ stripped) and split into padded word
+# trigrams; a row's score is the share of the query's trigrams it contains, with a small
+# bonus when they are found in Dự án/Loại hình rather than only in the notes.
+FUZZY_FIELDS = {"Dự án": 1.0, "Loại hình": 1.0, "Notice": 0.0}
+FUZZY_MIN_SCORE = 0.5
+FIELD_BONUS = 0.1
+COMBINING = re.compile("[\u0300-\u036f]")
+NON_WORD = re.compile(r"[^0-9a-z]+")
+
+
+def fold(text):
+    text = unicodedata.normalize("NFD", str(text).replace("đ", "d").replace("Đ", "D"))
+    return NON_WORD.sub(" ", COMBINING.sub("", text).lower()).strip()
+
+
+def _fold_column(values):
+    # Folding is done once per distinct value
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object).fillna(""), sort=False)
+    folded = np.array([fold(v) for v in uniques] or [""], dtype=object)
+    return folded[codes] if len(codes) else np.array([], dtype=object)
+
+
+def word_trigrams(folded):
+    grams = set()
+    for word in folded.split():
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class GramIndex:
+    # Trigram -> row ids, built over the distinct folded values of a column. All posting
+    # lists live in one array sorted by trigram; each trigram maps to a slice of it.
+    def __init__(self, texts):
+        codes, uniques = pd.factorize(pd.Series(texts, dtype=object), sort=False)
+        gram_ids = {}
+        pair_grams, pair_docs = [], []
+        for doc, text in enumerate(uniques):
+            for gram in word_trigrams(text):
+                pair_grams.append(gram_ids.setdefault(gram, len(gram_ids)))
+                pair_docs.append(doc)
+        pair_grams = np.asarray(pair_grams, dtype=np.int64)
+        pair_docs = np.asarray(pair_docs, dtype=np.int64)
+        # Expand (trigram, distinct value) pairs to (trigram, row) pairs
+        order = np.argsort(codes, kind="stable")
+        counts = np.bincount(codes, minlength=len(uniques))
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        reps = counts[pair_docs]
+        offsets = np.arange(reps.sum()) - np.repeat(np.cumsum(reps) - reps, reps)
+        rows = order[np.repeat(starts[pair_docs], reps) + offsets]
+        grams = np.repeat(pair_grams, reps)
+        by_gram = np.argsort(grams, kind="stable")
+        self._rows = rows[by_gram].astype(np.int32)
+        bounds = np.searchsorted(grams[by_gram], np.arange(len(gram_ids) + 1))
+        self._slices = {gram: (bounds[i], bounds[i + 1]) for gram, i in gram_ids.items()}
+        self.size = len(codes)
+
+    def rows(self, gram):
+        return self._rows[slice(*self._slices.get(gram, (0, 0)))]
+
+
+class FuzzyIndex:
+    def __init__(self, df, version=None):
+        self.version = version
+        self.size = len(df)
+        self.fields = {c: GramIndex(_fold_column(df[c])) for c in FUZZY_FIELDS}
+
+    def query(self, text, min_score=FUZZY_MIN_SCORE, limit=None):
+        grams = word_trigrams(fold(text))
+        if not grams:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        found = np.zeros(self.size, dtype=np.int32)
+        bonus = np.zeros(self.size)
+        # Fields in rising weight, so a row's trigram ends up with the best field it is in
+        fields = sorted(self.fields.items(), key=lambda item: FUZZY_FIELDS[item[0]])
+        weight = np.empty(self.size)
+        for gram in grams:
+            # Each trigram counts once per row, however many fields contain it
+            weight.fill(-1.0)
+            for field, index in fields:
+                weight[index.rows(gram)] = FUZZY_FIELDS[field]
+            hit = weight >= 0
+            found += hit
+            bonus += weight * hit
+        score = (found + FIELD_BONUS * bonus) / len(grams)
+        ids = np.flatnonzero(score >= min_score)
+        ids = ids[np.argsort(-score[ids], kind="stable")]
+        if limit is not None:
+            ids = ids[:limit]
+        return ids, score[ids]
+
+
+# === Query result cache ===
+# search() results as positional row ids and rank() results as listing IDs, keyed by the
+# normalized query and the data version they were computed on (so row ids stay valid).
+# The store owns one per process, so every session shares it: the same filters on
+# unchanged data are answered without touching the indexes.
+# A write bumps the data version, which drops every cached result; otherwise the least
+# recently used results go first once their total size passes max_bytes.
+ENTRY_OVERHEAD = 256  # rough per-entry cost of the key, dict slot and array object
+
+
+def search_key(loai_hinh="", du_an="", min_price=0, max_price=float("inf"), min_area=0, max_area=float("inf")):
+    def term(value):
+        value = str(value or "")
+        # Matching is case-insensitive, so case only matters inside a regex (\d vs \D)
+        return value if REGEX_CHARS & set(value) else value.lower()
+
+    return ("search", term(loai_hinh), term(du_an), float(min_price), float(max_price), float(min_area),
+            float(max_area))
+
+
+def rank_key(text, limit=None):
+    return ("rank", fold(text), limit)
+
+
+class QueryCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> row ids / IDs, oldest first
+        self._version = None
+        self._total = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _size(ids):
+        return ids.nbytes + ENTRY_OVERHEAD
+
+    def get(self, version, key):
+        with self._lock:
+            ids = self._entries.get(key) if version == self._version else None
+            if ids is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return ids
+
+    def put(self, version, key, ids):
+        size = self._size(ids)
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._total = 0
+                self._version = version
+            if size > self.max_bytes:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total -= self._size(old)
+            self._entries[key] = ids
+            self._total += size
+            while self._total > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._total -= self._size(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._total,
+        }
@@ -0,0 +1,145 @@
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+from backup import write_zip
+from images import MAX_SIDE, list_images
+
+# === Share packages ===
+# "📤 Chia sẻ" builds chia_se/<Loại hình>_<ID>/ on a background worker: share-ready photos
+# (JPEG, at most SHARE_MAX_SIDE px, no EXIF) plus thong_tin.txt. Photos that are already
+# share-ready are hardlinked instead of copied, downsized ones keep the source mtime so a
+# repeated share skips every file that hasn't changed, and files no longer in the listing
+# are removed. A ZIP of the package is built on demand for download.
+# SHARE_MAX_SIDE defaults to the ingest limit, so JPEGs stored by the upload pipeline are
+# share-ready as they are; a smaller limit re-encodes (and stores a second copy of) each photo.
+SHARE_MAX_SIDE = int(os.environ.get("BDS_SHARE_MAX_SIDE", MAX_SIDE))
+SHARE_QUALITY = int(os.environ.get("BDS_SHARE_QUALITY", "82"))
+INFO_FILE = "thong_tin.txt"
+
+
+def _share_ready(path, max_side):
+    with Image.open(path) as img:
+        return img.format == "JPEG" and max(img.size) <= max_side and not img.getexif()
+
+
+def _link(src, dest):
+    try:
+        os.link(src, dest)
+        return True
+    except OSError:
+        # Different filesystem or no hardlink support: fall back to a plain copy
+        shutil.copy2(src, dest)
+        return False
+
+
+def _render(src, dest, max_side, quality):
+    with Image.open(src) as img:
+        if img.format == "JPEG":
+            img.draft("RGB", (max_side, max_side))
+        img = ImageOps.exif_transpose(img)
+        if max(img.size) > max_side:
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+        img.convert("RGB").save(dest + ".part", "JPEG", quality=quality, optimize=True)
+    os.replace(dest + ".part", dest)
+    st = os.stat(src)
+    os.utime(dest, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+
+def _write_if_changed(path, text):
+    try:
+        with open(path, encoding="utf-8") as f:
+            if f.read() == text:
+                return False
+    except FileNotFoundError:
+        pass
+    with open(path + ".part", "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(path + ".part", path)
+    return True
+
+
+def build_package(folder, dest, info, max_side=SHARE_MAX_SIDE, quality=SHARE_QUALITY, images=None, previous=None):
+    # images: the listing's photo paths (from the image manifest); previous: the package's
+    # file names after the last build. Either is only read from disk when not given.
+    os.makedirs(dest, exist_ok=True)
+    report = {"dest": dest, "files": 0, "linked": 0, "resized": 0, "copied": 0, "unchanged": 0, "skipped": []}
+    wanted = {INFO_FILE}
+    if images is None:
+        images = list_images(folder) if os.path.isdir(folder) else []
+    for src in images:
+        base, ext = os.path.splitext(os.path.basename(src))
+        try:
+            ready = _share_ready(src, max_side)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            report["skipped"].append(os.path.basename(src))
+            continue
+        name = base + ext if ready else base + ".jpg"
+        if name in wanted:
+            name = f"{base}_{len(wanted)}.jpg"
+        wanted.add(name)
+        out = os.path.join(dest, name)
+        report["files"] += 1
+        if os.path.exists(out):
+            if ready and os.path.samefile(src, out):
+                report["unchanged"] += 1
+                continue
+            if not ready and os.stat(out).st_mtime_ns == os.stat(src).st_mtime_ns:
+                report["unchanged"] += 1
+                continue
+            os.remove(out)
+        if not ready:
+            _render(src, out, max_side, quality)
+            report["resized"] += 1
+        elif _link(src, out):
+            report["linked"] += 1
+        else:
+            report["copied"] += 1
+    for name in os.listdir(dest) if previous is None else previous:
+        if name not in wanted:
+            try:
+                os.remove(os.path.join(dest, name))
+            except FileNotFoundError:
+                pass
+    _write_if_changed(os.path.join(dest, INFO_FILE), info)
+    report["names"] = sorted(wanted)
+    return report
+
+
+class ShareExporter:
+    def __init__(self, share_dir, max_side=SHARE_MAX_SIDE, quality=SHARE_QUALITY, workers=2):
+        self.share_dir = share_dir
+        self.max_side = max_side
+        self.quality = quality
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="share")
+        self._lock = threading.Lock()
+        self._jobs = {}  # listing id -> Future of the latest build
+        os.makedirs(share_dir, exist_ok=True)
+
+    def submit(self, listing_id, folder, name, info, images=None):
+        # A click while a build for the same listing is still running joins that build
+        with self._lock:
+            job = self._jobs.get(listing_id)
+            if job is not None and not job.done():
+                return job
+            dest = os.path.join(self.share_dir, name)
+            previous = None
+            if job is not None and job.exception() is None and job.result()["dest"] == dest:
+                previous = job.result()["names"]
+            job = self._pool.submit(build_package, folder, dest, info, self.max_side, self.quality, images, previous)
+            self._jobs[listing_id] = job
+            return job
+
+    def job(self, listing_id):
+        return self._jobs.get(listing_id)
+
+    def zip(self, listing_id):
+        # <package>.zip next to the folder, rebuilt only when the folder changed since
+        dest = self._jobs[listing_id].result()["dest"]
+        path = dest + ".zip"
+        if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(dest):
+            write_zip(dest, path)
+        return path
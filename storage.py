@@ -0,0 +1,889 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+from analytics import Rollups
+from search import REGEX_CHARS, FuzzyIndex, QueryCache, SearchIndex, rank_key, search_key
+
+# === Schema ===
+# Explicit in-memory types for the listings table, applied on every load and every write:
+# the few distinct Loại hình/Dự án values are categorical, Diện tích is float32 (Giá and
+# Lợi nhuận stay float64: float32 can't hold a price like 2345678900 exactly) and free
+# text uses pandas' compact string storage (Arrow-backed when pyarrow is installed).
+# Rows are indexed by a persistent integer ID (the first CSV column) that never changes
+# once assigned, so edits, deletes, image folders and widget keys don't depend on positions.
+ID_COLUMN = "ID"
+COLUMNS = ["Loại hình", "Dự án", "Giá", "Diện tích", "SĐT", "Lợi nhuận", "Notice", "Thư mục ảnh"]
+NUMERIC_COLUMNS = ["Giá", "Diện tích", "Lợi nhuận"]
+CATEGORY_COLUMNS = ["Loại hình", "Dự án"]
+TEXT_COLUMNS = [c for c in COLUMNS if c not in NUMERIC_COLUMNS]
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    STRING_DTYPE = pd.StringDtype("pyarrow")
+except ImportError:
+    pa = None
+    STRING_DTYPE = pd.StringDtype("python")
+FLOAT32_COLUMNS = ["Diện tích"]
+SCHEMA = {
+    c: "category" if c in CATEGORY_COLUMNS
+    else ("float32" if c in FLOAT32_COLUMNS else "float64") if c in NUMERIC_COLUMNS
+    else STRING_DTYPE
+    for c in COLUMNS
+}
+
+
+class ValidationError(ValueError):
+    pass
+
+
+class ConflictError(RuntimeError):
+    # The row changed since the caller read it (optimistic concurrency check in update())
+    pass
+
+
+def parse_number(value):
+    # "1.5", "1,5", " 2 " -> float; "" -> NaN; anything else raises ValueError
+    if value is None or (isinstance(value, float) and value != value):
+        return float("nan")
+    text = str(value).strip().replace(" ", "")
+    if not text:
+        return float("nan")
+    if "," in text and "." not in text:
+        text = text.replace(",", ".")
+    return float(text)
+
+
+def validate_listing(values):
+    # Form input -> typed values for append()/update(); raises ValidationError with the message to show
+    out = dict(values)
+    try:
+        out["Giá"] = parse_number(values["Giá"])
+        out["Diện tích"] = parse_number(values["Diện tích"])
+    except ValueError:
+        raise ValidationError("Vui lòng nhập đúng định dạng Giá và Diện tích.")
+    if out["Giá"] != out["Giá"] or out["Diện tích"] != out["Diện tích"]:
+        raise ValidationError("Vui lòng nhập đúng định dạng Giá và Diện tích.")
+    if "Lợi nhuận" in values:
+        try:
+            out["Lợi nhuận"] = parse_number(values["Lợi nhuận"])
+        except ValueError:
+            raise ValidationError("Lợi nhuận phải là số (để trống nếu chưa có).")
+    for c in TEXT_COLUMNS:
+        if c in out:
+            out[c] = "" if out[c] is None else str(out[c])
+    return out
+
+
+def format_number(value, column=None):
+    # Back to the text the user typed, never in scientific notation: 2345678900, and 6.3 rather
+    # than 6.300000190734863 for a float32 column; "" for NaN
+    if pd.isna(value):
+        return ""
+    value = np.float32(value) if column in FLOAT32_COLUMNS else np.float64(value)
+    return np.format_float_positional(value, trim="-")
+
+
+def parse_numbers(values):
+    # Vectorized parse_number() over a column of text: (floats, mask of values that didn't parse)
+    text = values.astype(object).where(values.notna(), "").astype(str).str.strip().str.replace(" ", "", regex=False)
+    comma = text.str.contains(",", regex=False) & ~text.str.contains(".", regex=False)
+    text = text.where(~comma, text.str.replace(",", ".", regex=False))
+    numbers = pd.to_numeric(text, errors="coerce")
+    return numbers, numbers.isna() & (text != "") & (text.str.lower() != "nan")
+
+
+def validate_frame(df):
+    # Vectorized validate_listing() for imports: (typed frame of the valid rows, {row label: message})
+    df = df.copy()
+    for c in COLUMNS:
+        if c not in df.columns:
+            df[c] = ""
+    gia, bad_gia = parse_numbers(df["Giá"])
+    dien_tich, bad_dien_tich = parse_numbers(df["Diện tích"])
+    profit, bad_profit = parse_numbers(df["Lợi nhuận"])
+    errors = pd.Series("", index=df.index, dtype=object)
+    errors[profit.isna() & bad_profit] = "Lợi nhuận phải là số (để trống nếu chưa có)."
+    errors[gia.isna() | dien_tich.isna()] = "Vui lòng nhập đúng định dạng Giá và Diện tích."
+    df["Giá"], df["Diện tích"], df["Lợi nhuận"] = gia, dien_tich, profit
+    ok = errors == ""
+    return apply_schema(df[ok]), errors[~ok].to_dict()
+
+
+def apply_schema(df):
+    df = df.copy()
+    ids = df.pop(ID_COLUMN) if ID_COLUMN in df.columns else df.index.to_series()
+    for c in COLUMNS:
+        if c not in df.columns:
+            df[c] = float("nan") if c in NUMERIC_COLUMNS else ""
+    for c in TEXT_COLUMNS:
+        df[c] = df[c].astype(object).where(df[c].notna(), "").astype(str)
+    # Lợi nhuận used to be free text: keep any non-numeric value readable in Notice instead of dropping it
+    profit = df["Lợi nhuận"].astype(object)
+    parsed = pd.to_numeric(profit.map(_try_number), errors="coerce")
+    bad = parsed.isna() & profit.notna() & (profit.astype(str).str.strip() != "") & (profit.astype(str) != "nan")
+    if bad.any():
+        df.loc[bad, "Notice"] = (df.loc[bad, "Notice"] + " [Lợi nhuận: " + profit[bad].astype(str) + "]").str.strip()
+    df["Lợi nhuận"] = parsed
+    for c in ["Giá", "Diện tích"]:
+        df[c] = pd.to_numeric(df[c], errors="coerce")
+    df = df[COLUMNS].astype(SCHEMA)
+    df.index = _clean_ids(ids)
+    return df
+
+
+def _clean_ids(ids):
+    # Rows without a usable ID (legacy CSV, hand edits, duplicates) get fresh ones after the current max
+    ids = pd.to_numeric(pd.Series(ids).reset_index(drop=True), errors="coerce")
+    bad = ids.isna() | ids.duplicated() | (ids != ids.round())
+    if bad.any():
+        start = int(ids[~bad].max()) + 1 if (~bad).any() else 0
+        ids[bad] = np.arange(start, start + int(bad.sum()))
+    return pd.Index(ids.astype("int64"), name=ID_COLUMN)
+
+
+def to_csv(df, path_or_buf=None, **kwargs):
+    # IDs are written as the first column; returns the text when no target is given
+    return df.to_csv(path_or_buf, index_label=ID_COLUMN, **kwargs)
+
+
+def _try_number(value):
+    try:
+        return parse_number(value)
+    except ValueError:
+        return float("nan")
+
+
+def empty_frame():
+    return apply_schema(pd.DataFrame(columns=COLUMNS))
+
+
+def read_csv(path):
+    # Text columns are read as strings so SĐT keeps leading zeros
+    return apply_schema(pd.read_csv(path, dtype={c: str for c in TEXT_COLUMNS + ["Lợi nhuận"]}, keep_default_na=False,
+                                    na_values={c: [""] for c in NUMERIC_COLUMNS}))
+
+
+def next_free_id(df):
+    # First ID past both the row IDs and the numeric suffixes of the photo folders: legacy
+    # folders were named "<Loại hình>_<row count at the time>", which runs past the row IDs
+    # once rows have been deleted, and a new listing must not land in one of them
+    next_id = int(df.index.max()) + 1 if len(df) else 0
+    suffixes = df["Thư mục ảnh"].astype(str).str.extract(r"_(\d+)$", expand=False).dropna()
+    return max(next_id, int(suffixes.astype(int).max()) + 1 if len(suffixes) else 0)
+
+
+def append_rows(df, rows, ids):
+    return concat_frames(df, apply_schema(pd.DataFrame(rows, columns=COLUMNS, index=ids)))
+
+
+def concat_frames(df, new):
+    # Concatenates without losing the categorical dtypes (categories are unioned first)
+    df = df.copy()
+    new = new.copy()
+    for c in CATEGORY_COLUMNS:
+        categories = df[c].cat.categories.union(new[c].cat.categories)
+        df[c] = df[c].cat.set_categories(categories)
+        new[c] = new[c].cat.set_categories(categories)
+    return pd.concat([df, new])
+
+
+def set_values(df, index, values):
+    # Returns a new frame; only the changed columns are copied, so frames already handed out stay untouched
+    df = df.copy(deep=False)
+    for col, value in values.items():
+        column = df[col].copy()
+        if col in CATEGORY_COLUMNS and value not in column.cat.categories:
+            column = column.cat.add_categories([value])
+        column.at[index] = value
+        df[col] = column
+    return df
+
+
+def file_signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+# === Columnar sidecar ===
+# An Arrow IPC copy of the CSV (<csv>.arrow) that loads through a memory map in a fraction
+# of the CSV parse time and keeps the schema's dtypes. Its metadata records the signature
+# of the CSV it was written from; a sidecar that doesn't match is ignored and rewritten.
+SIDECAR_KEY = b"bds_base"
+
+
+def read_sidecar(path, base_sig):
+    if pa is None or base_sig is None or not os.path.exists(path):
+        return None
+    try:
+        with pa.memory_map(path) as source:
+            reader = ipc.open_file(source)
+            meta = reader.schema.metadata or {}
+            if json.loads(meta.get(SIDECAR_KEY, b"null")) != list(base_sig):
+                return None
+            df = reader.read_all().to_pandas()
+    except (OSError, pa.ArrowInvalid, ValueError):
+        return None
+    df = df.astype(SCHEMA)
+    df.index = df.index.astype("int64").rename(ID_COLUMN)
+    return df
+
+
+def write_sidecar(df, path, base_sig):
+    if pa is None or base_sig is None:
+        return False
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), SIDECAR_KEY: json.dumps(list(base_sig))})
+    tmp = path + ".tmp"
+    try:
+        with pa.OSFile(tmp, "wb") as sink, ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp, path)
+    except OSError:
+        # e.g. the old sidecar is still mapped on Windows: it's stale now and the next load reparses the CSV
+        return False
+    return True
+
+
+# === Listing store ===
+# The CSV is a compacted base snapshot; every add/edit/delete since then is appended to a
+# JSON-lines journal next to it, so a write costs one small append instead of a full rewrite.
+# The first journal line records the signature of the base it applies to (after a compaction
+# or a manual edit of the CSV a journal that doesn't match is stale and ignored) and the
+# next unused ID, so IDs of deleted listings are never handed out again.
+# The parsed frame is kept in memory for the whole process and reused by every session and
+# rerun until either file changes on disk. With sidecar=True the base snapshot is loaded
+# from the Arrow sidecar whenever it matches the CSV.
+# Writes are serialized by a lock and never modify a published frame (each one produces a
+# new frame), so load() is a lock-free read of the current snapshot. Every row carries a
+# version number, bumped on each write to it, for optimistic checks in update().
+# search() and rank() results are cached per data version (see search.QueryCache).
+QUERY_CACHE_BYTES = 64 * 1024 * 1024
+
+
+class ListingStore:
+    def __init__(self, csv_path, journal_path=None, compact_every=500, sidecar=False,
+                 query_cache_bytes=QUERY_CACHE_BYTES):
+        self.csv_path = csv_path
+        self.journal_path = journal_path or csv_path + ".journal"
+        self.sidecar_path = csv_path + ".arrow" if sidecar and pa is not None else None
+        self.compact_every = compact_every
+        self._lock = threading.RLock()
+        self._df = None
+        self._sig = None
+        self._snapshot = None
+        self._pending = 0
+        self._next_id = 0
+        self._folders_seen = False
+        self._epoch = 0
+        self._row_versions = {}
+        self._index = None
+        self._fuzzy = None
+        self._rollups = None
+        self.queries = QueryCache(query_cache_bytes)
+        self.hits = 0
+        self.misses = 0
+        self.version = 0
+
+    def _signature(self):
+        return (file_signature(self.csv_path), file_signature(self.journal_path))
+
+    def _read_journal(self, base_sig):
+        ops = []
+        if not os.path.exists(self.journal_path):
+            return 0, ops
+        with open(self.journal_path, encoding="utf-8") as f:
+            header = f.readline()
+            if not header:
+                return 0, ops
+            header = json.loads(header)
+            base = header.get("base")
+            if (tuple(base) if base else None) != base_sig:
+                return 0, ops
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    ops.append(json.loads(line))
+                except ValueError:
+                    break  # torn write at the tail of the journal
+        return header.get("next_id", 0), ops
+
+    def _apply(self, df, op):
+        kind = op["op"]
+        # Journals written before IDs existed address rows by position ("index")
+        listing_id = op["id"] if "id" in op else None
+        if kind == "add":
+            if listing_id is None:
+                listing_id = self._next_id
+            self._next_id = max(self._next_id, listing_id + 1)
+            self._row_versions[listing_id] = 1
+            row = {c: op["row"].get(c, float("nan") if c in NUMERIC_COLUMNS else "") for c in COLUMNS}
+            return append_rows(df, [row], [listing_id])
+        if listing_id is None:
+            listing_id = df.index[op["index"]]
+        if kind == "update":
+            self._row_versions[listing_id] = self._row_versions.get(listing_id, 0) + 1
+            return set_values(df, listing_id, op["values"])
+        if kind == "delete":
+            self._row_versions.pop(listing_id, None)
+            return df.drop(listing_id)
+        raise ValueError(f"Unknown journal op: {kind}")
+
+    def _reload(self):
+        base_sig = file_signature(self.csv_path)
+        df = self._read_base(base_sig)
+        next_id, ops = self._read_journal(base_sig)
+        self._next_id = max(self._next_id, next_id, int(df.index.max()) + 1 if len(df) else 0)
+        # Rows may have changed behind our back (another process, a manual edit): versions
+        # handed out before this reload no longer match anything
+        self._epoch += 1
+        self._row_versions = {}
+        self._rollups = None
+        for op in ops:
+            df = self._apply(df, op)
+        self._folders_seen = False
+        self._df = df
+        self._pending = len(ops)
+        self._sig = self._signature()
+        self.version += 1
+        self._publish()
+
+    def _publish(self):
+        # One attribute assignment, so lock-free readers see either the old or the new state
+        self._snapshot = (self._df, self._sig, self.version)
+
+    def _read_base(self, base_sig):
+        if base_sig is None:
+            return empty_frame()
+        if self.sidecar_path is None:
+            return read_csv(self.csv_path)
+        df = read_sidecar(self.sidecar_path, base_sig)
+        if df is None:
+            df = read_csv(self.csv_path)
+            write_sidecar(df, self.sidecar_path, base_sig)
+        return df
+
+    def snapshot(self):
+        # (frame, version) as of now; the frame is never modified afterwards
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot[1] == self._signature():
+            self.hits += 1
+            return snapshot[0], snapshot[2]
+        with self._lock:
+            if self._df is not None and self._sig == self._signature():
+                self.hits += 1
+            else:
+                self.misses += 1
+                self._reload()
+            return self._df, self.version
+
+    def load(self):
+        return self.snapshot()[0]
+
+    def row_version(self, listing_id):
+        # Token to pass back as update(expected_version=...); None if the listing doesn't exist
+        with self._lock:
+            if listing_id not in self.load().index:
+                return None
+            return [self._epoch, self._row_versions.get(listing_id, 0)]
+
+    def _record(self, op, expected_version=None):
+        # Pick up writes made by another process before appending on top of them
+        if self._df is None or self._sig != self._signature():
+            self._reload()
+        if op["op"] == "add" and op["id"] in self._df.index:
+            op["id"] = self._next_id  # reserved here but taken by another process in the meantime
+        elif op["op"] != "add" and op["id"] not in self._df.index:
+            raise KeyError(op["id"])
+        if expected_version is not None and list(expected_version) != [self._epoch, self._row_versions.get(op["id"], 0)]:
+            raise ConflictError(op["id"])
+        if not os.path.exists(self.journal_path):
+            self._write_journal_header(self.journal_path, file_signature(self.csv_path), self._next_id)
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(op, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        old = self._df.loc[op["id"]] if op["op"] != "add" else None
+        self._df = self._apply(self._df, op)
+        if self._rollups is not None:
+            if old is not None:
+                self._rollups.remove(old)
+            if op["op"] != "delete":
+                self._rollups.add(self._df.loc[op["id"]])
+        self._pending += 1
+        self._sig = self._signature()
+        self.version += 1
+        self._publish()
+        if self._pending >= self.compact_every:
+            self.compact()
+        return op["id"]
+
+    def new_id(self):
+        # Reserves an ID up front, e.g. to name the image folder before the row is added
+        return self.new_ids(1)[0]
+
+    def new_ids(self, n):
+        with self._lock:
+            df = self.load()
+            if not self._folders_seen:
+                # Once per reload; rows added since then got folders named after their own IDs
+                self._next_id = max(self._next_id, next_free_id(df))
+                self._folders_seen = True
+            start = self._next_id
+            self._next_id += n
+            return list(range(start, start + n))
+
+    def append(self, row, listing_id=None):
+        with self._lock:
+            if listing_id is None:
+                listing_id = self.new_id()
+            return self._record({"op": "add", "id": int(listing_id), "row": _jsonable(row)})
+
+    def append_many(self, frame):
+        # Bulk import: the whole batch (indexed by IDs from new_ids()) lands in one CSV rewrite
+        # instead of a journal entry per row
+        with self._lock:
+            if self._df is None or self._sig != self._signature():
+                self._reload()
+            frame = apply_schema(frame)
+            taken = frame.index.isin(self._df.index)
+            if taken.any():
+                # Reserved here but taken by another process in the meantime
+                ids = frame.index.to_numpy().copy()
+                ids[taken] = np.arange(self._next_id, self._next_id + int(taken.sum()))
+                frame.index = pd.Index(ids, name=ID_COLUMN)
+            self._df = concat_frames(self._df, frame)
+            self._next_id = max(self._next_id, int(frame.index.max()) + 1 if len(frame) else 0)
+            self._row_versions.update(dict.fromkeys(frame.index, 1))
+            self._rollups = None  # rebuilt in one pass on next use
+            self.compact()
+            return list(frame.index)
+
+    def update(self, listing_id, values, expected_version=None):
+        # Raises KeyError if the listing no longer exists and ConflictError if expected_version
+        # (from row_version()) is given and the row has been written since
+        with self._lock:
+            self._record({"op": "update", "id": int(listing_id), "values": _jsonable(values)}, expected_version)
+
+    def delete(self, listing_id):
+        with self._lock:
+            try:
+                self._record({"op": "delete", "id": int(listing_id)})
+            except KeyError:
+                pass  # already gone
+
+    def replace(self, df):
+        with self._lock:
+            self._df = apply_schema(df)
+            self._next_id = max(self._next_id, next_free_id(self._df))
+            self._epoch += 1
+            self._row_versions = {}
+            self._rollups = None
+            self.compact()
+
+    def compact(self):
+        with self._lock:
+            if self._df is None:
+                self._reload()
+            tmp_csv = self.csv_path + ".tmp"
+            tmp_journal = self.journal_path + ".tmp"
+            with open(tmp_csv, "w", encoding="utf-8", newline="") as f:
+                to_csv(self._df, f)
+                f.flush()
+                os.fsync(f.fileno())
+            # The rename keeps the temp file's mtime/size, so the new journal can point at it up front
+            self._write_journal_header(tmp_journal, file_signature(tmp_csv), self._next_id)
+            os.replace(tmp_csv, self.csv_path)
+            if self.sidecar_path:
+                write_sidecar(self._df, self.sidecar_path, file_signature(self.csv_path))
+            os.replace(tmp_journal, self.journal_path)
+            self._pending = 0
+            self._sig = self._signature()
+            self.version += 1
+            self._publish()
+
+    @staticmethod
+    def _write_journal_header(path, base_sig, next_id):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"base": list(base_sig) if base_sig else None, "next_id": next_id}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def search(self, *args, **kwargs):
+        # Indexes are built from a snapshot outside the write lock; two readers racing on a
+        # new version may both build one, which is harmless
+        df, version = self.snapshot()
+        key = search_key(*args, **kwargs)
+        rows = self.queries.get(version, key)
+        if rows is None:
+            index = self._index
+            if index is None or index.version != version:
+                index = self._index = SearchIndex(df, version)
+            rows = index.query(*args, **kwargs)
+            self.queries.put(version, key, rows)
+        return df.iloc[rows]
+
+    def rank(self, text, limit=None):
+        # Fuzzy text search; returns the matching labels of load() best first
+        df, version = self.snapshot()
+        key = rank_key(text, limit)
+        ids = self.queries.get(version, key)
+        if ids is not None:
+            return ids
+        fuzzy = self._fuzzy
+        if fuzzy is None or fuzzy.version != version:
+            fuzzy = self._fuzzy = FuzzyIndex(df, version)
+        positions, _ = fuzzy.query(text, limit=limit)
+        ids = df.index[positions]
+        self.queries.put(version, key, ids)
+        return ids
+
+    def rollups(self):
+        # Analytics rollups; built once from the table, then updated by each write
+        self.load()
+        with self._lock:
+            if self._rollups is None:
+                self._rollups = Rollups(self._df)
+            return self._rollups
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "version": self.version,
+            "journal_ops": self._pending,
+        }
+
+
+def _jsonable(values):
+    out = {}
+    for k, v in values.items():
+        out[k] = v.item() if hasattr(v, "item") else v
+    return out
+
+
+# === SQLite store ===
+# Optional backend (BDS_STORAGE=sqlite): one local database file holding the same columns,
+# with B-tree indexes on Giá/Diện tích and a trigram FTS5 index over the text columns so
+# search runs in SQL and only matching rows are loaded into pandas.
+SQL_COLUMNS = {
+    "Loại hình": "loai_hinh",
+    "Dự án": "du_an",
+    "Giá": "gia",
+    "Diện tích": "dien_tich",
+    "SĐT": "sdt",
+    "Lợi nhuận": "loi_nhuan",
+    "Notice": "notice",
+    "Thư mục ảnh": "thu_muc_anh",
+}
+FROM_SQL = {v: k for k, v in SQL_COLUMNS.items()}
+FTS_COLUMNS = ["loai_hinh", "du_an", "notice"]
+
+
+def _py_contains(pattern, value):
+    # Same matching as pandas str.contains(case=False)
+    if value is None:
+        return 0
+    return 1 if re.search(pattern, value, re.IGNORECASE) else 0
+
+
+class SQLiteListingStore:
+    def __init__(self, db_path, csv_path=None, query_cache_bytes=QUERY_CACHE_BYTES):
+        self.db_path = db_path
+        self.csv_path = csv_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.create_function("py_contains", 2, _py_contains, deterministic=True)
+        self._df = None
+        self._seen = None
+        self._fuzzy = None
+        self._rollups = None
+        self._rollups_seen = None
+        self.queries = QueryCache(query_cache_bytes)
+        self.hits = 0
+        self.misses = 0
+        self.version = 0
+        self.fts = False
+        self._init_schema()
+
+    def _init_schema(self):
+        cols = ", ".join(
+            f"{c} REAL" if name in NUMERIC_COLUMNS else f"{c} TEXT" for name, c in SQL_COLUMNS.items()
+        )
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS listings (id INTEGER PRIMARY KEY, {cols}, row_version INTEGER NOT NULL DEFAULT 0)"
+            )
+            if "row_version" not in {r[1] for r in self._conn.execute("PRAGMA table_info(listings)")}:
+                self._conn.execute("ALTER TABLE listings ADD COLUMN row_version INTEGER NOT NULL DEFAULT 0")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_listings_gia ON listings (gia)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_listings_dien_tich ON listings (dien_tich)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            try:
+                self._create_fts()
+                self.fts = True
+            except sqlite3.OperationalError:
+                pass  # SQLite built without FTS5/trigram: search falls back to py_contains scans
+        migrated = self._conn.execute("SELECT value FROM meta WHERE key = 'migrated_from'").fetchone()
+        if migrated is None and self.csv_path and os.path.exists(self.csv_path):
+            self.migrate_csv(self.csv_path)
+
+    def _create_fts(self):
+        fts_cols = ", ".join(FTS_COLUMNS)
+        new_cols = ", ".join(f"new.{c}" for c in FTS_COLUMNS)
+        old_cols = ", ".join(f"old.{c}" for c in FTS_COLUMNS)
+        self._conn.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS listings_fts USING fts5("
+            f"{fts_cols}, content='listings', content_rowid='id', tokenize='trigram')"
+        )
+        self._conn.executescript(f"""
+            CREATE TRIGGER IF NOT EXISTS listings_ai AFTER INSERT ON listings BEGIN
+                INSERT INTO listings_fts (rowid, {fts_cols}) VALUES (new.id, {new_cols});
+            END;
+            CREATE TRIGGER IF NOT EXISTS listings_ad AFTER DELETE ON listings BEGIN
+                INSERT INTO listings_fts (listings_fts, rowid, {fts_cols}) VALUES ('delete', old.id, {old_cols});
+            END;
+            CREATE TRIGGER IF NOT EXISTS listings_au AFTER UPDATE ON listings BEGIN
+                INSERT INTO listings_fts (listings_fts, rowid, {fts_cols}) VALUES ('delete', old.id, {old_cols});
+                INSERT INTO listings_fts (rowid, {fts_cols}) VALUES (new.id, {new_cols});
+            END;
+        """)
+
+    def migrate_csv(self, csv_path):
+        # One-shot import of the existing CSV, including the writes still in its journal;
+        # afterwards the database is the store. IDs the CSV store handed out are not reused.
+        source = ListingStore(csv_path)
+        self.replace(source.load())
+        with self._lock, self._conn:
+            self._bump_next_id(source.new_id())
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from', ?)", (os.path.abspath(csv_path),)
+            )
+
+    def _data_version(self):
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _read(self, where="", params=()):
+        cols = ", ".join(["id"] + list(SQL_COLUMNS.values()))
+        df = pd.read_sql_query(f"SELECT {cols} FROM listings {where} ORDER BY id", self._conn, params=params, index_col="id")
+        return apply_schema(df.rename(columns=FROM_SQL))
+
+    def snapshot(self):
+        with self._lock:
+            return self.load(), self._seen
+
+    def row_version(self, listing_id):
+        with self._lock:
+            row = self._conn.execute("SELECT row_version FROM listings WHERE id = ?", (int(listing_id),)).fetchone()
+        return None if row is None else row[0]
+
+    def load(self):
+        with self._lock:
+            seen = (self.version, self._data_version())
+            if self._df is not None and self._seen == seen:
+                self.hits += 1
+            else:
+                self.misses += 1
+                self._df = self._read()
+                self._seen = seen
+            return self._df
+
+    def _row_params(self, row):
+        return [
+            _sql_value(row.get(name, float("nan") if name in NUMERIC_COLUMNS else "")) for name in SQL_COLUMNS
+        ]
+
+    def _bump_next_id(self, at_least):
+        # meta.next_id only moves forward, so IDs of deleted rows are never reused
+        self._conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('next_id', ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = MAX(CAST(value AS INTEGER), CAST(excluded.value AS INTEGER))",
+            (int(at_least),),
+        )
+
+    def new_id(self):
+        return self.new_ids(1)[0]
+
+    def new_ids(self, n):
+        with self._lock, self._conn:
+            self._bump_next_id(self._conn.execute("SELECT COALESCE(MAX(id) + 1, 0) FROM listings").fetchone()[0])
+            start = int(self._conn.execute("SELECT value FROM meta WHERE key = 'next_id'").fetchone()[0])
+            self._bump_next_id(start + n)
+            return list(range(start, start + n))
+
+    def append_many(self, frame):
+        # One transaction for the whole batch
+        frame = apply_schema(frame)
+        cols = ", ".join(["id"] + list(SQL_COLUMNS.values()))
+        marks = ", ".join("?" for _ in range(len(SQL_COLUMNS) + 1))
+        rows = ([int(i)] + self._row_params(r) for i, r in zip(frame.index, frame.to_dict("records")))
+        with self._lock, self._conn:
+            self._conn.executemany(f"INSERT INTO listings ({cols}) VALUES ({marks})", rows)
+            if len(frame):
+                self._bump_next_id(int(frame.index.max()) + 1)
+            self.version += 1
+        return list(frame.index)
+
+    def append(self, row, listing_id=None):
+        cols = ", ".join(["id"] + list(SQL_COLUMNS.values()))
+        marks = ", ".join("?" for _ in range(len(SQL_COLUMNS) + 1))
+        with self._lock:
+            if listing_id is None:
+                listing_id = self.new_id()
+
+            def write():
+                with self._conn:
+                    self._conn.execute(f"INSERT INTO listings ({cols}) VALUES ({marks})",
+                                       [int(listing_id)] + self._row_params(row))
+                    self._bump_next_id(int(listing_id) + 1)
+                    self.version += 1
+
+            self._tracked(listing_id, write)
+            return int(listing_id)
+
+    def update(self, listing_id, values, expected_version=None):
+        # The version check is part of the UPDATE itself, so it also holds across processes
+        sets = ", ".join(f"{SQL_COLUMNS[k]} = ?" for k in values)
+        where = "id = ?"
+        params = [_sql_value(v) for v in values.values()] + [int(listing_id)]
+        if expected_version is not None:
+            where += " AND row_version = ?"
+            params.append(int(expected_version))
+
+        def write():
+            with self._conn:
+                cur = self._conn.execute(f"UPDATE listings SET {sets}, row_version = row_version + 1 WHERE {where}", params)
+                if cur.rowcount == 0:
+                    if self.row_version(listing_id) is None:
+                        raise KeyError(listing_id)
+                    raise ConflictError(listing_id)
+                self.version += 1
+
+        self._tracked(listing_id, write)
+
+    def delete(self, listing_id):
+        def write():
+            with self._conn:
+                self._conn.execute("DELETE FROM listings WHERE id = ?", (int(listing_id),))
+                self.version += 1
+
+        self._tracked(listing_id, write)
+
+    def _tracked(self, listing_id, write):
+        # Runs a single-row write and moves that row's before/after values through the rollups,
+        # as long as they are current (otherwise rollups() rebuilds them)
+        with self._lock:
+            track = self._rollups is not None and self._rollups_seen == (self.version, self._data_version())
+            before = self._read("WHERE id = ?", (int(listing_id),)) if track else None
+            write()
+            if track:
+                for _, row in before.iterrows():
+                    self._rollups.remove(row)
+                for _, row in self._read("WHERE id = ?", (int(listing_id),)).iterrows():
+                    self._rollups.add(row)
+                self._rollups_seen = (self.version, self._data_version())
+
+    def rollups(self):
+        with self._lock:
+            self.load()
+            if self._rollups is None or self._rollups_seen != self._seen:
+                self._rollups = Rollups(self._df)
+                self._rollups_seen = self._seen
+            return self._rollups
+
+    def replace(self, df):
+        df = apply_schema(df)
+        cols = ", ".join(["id"] + list(SQL_COLUMNS.values()))
+        marks = ", ".join("?" for _ in range(len(SQL_COLUMNS) + 1))
+        rows = ([int(i)] + self._row_params(r) for i, r in zip(df.index, df.to_dict("records")))
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM listings")
+            self._conn.executemany(f"INSERT INTO listings ({cols}) VALUES ({marks})", rows)
+            self._bump_next_id(next_free_id(df))
+            self.version += 1
+
+    def compact(self):
+        with self._lock:
+            self._conn.execute("VACUUM")
+
+    def rank(self, text, limit=None):
+        key = rank_key(text, limit)
+        with self._lock:
+            df = self.load()
+            version = self._seen
+            ids = self.queries.get(version, key)
+            if ids is not None:
+                return ids
+            if self._fuzzy is None or self._fuzzy.version != version:
+                self._fuzzy = FuzzyIndex(df, version)
+            fuzzy = self._fuzzy
+        positions, _ = fuzzy.query(text, limit=limit)
+        ids = df.index[positions]
+        self.queries.put(version, key, ids)
+        return ids
+
+    def search(self, loai_hinh="", du_an="", min_price=0, max_price=float("inf"), min_area=0, max_area=float("inf")):
+        key = search_key(loai_hinh, du_an, min_price, max_price, min_area, max_area)
+        with self._lock:
+            df = self.load()
+            version = self._seen
+            rows = self.queries.get(version, key)
+            if rows is not None:
+                return df.iloc[rows]
+        where = ["gia >= ?", "gia <= ?", "dien_tich >= ?", "dien_tich <= ?"]
+        params = [min_price, max_price, min_area, max_area]
+        match = []
+        for column, term in (("loai_hinh", loai_hinh), ("du_an", du_an)):
+            if not term:
+                continue
+            # The trigram index narrows literal terms down; py_contains keeps str.contains semantics exact
+            if self.fts and len(term) >= 3 and not REGEX_CHARS & set(term):
+                match.append(f'{column} : "{term.replace(chr(34), chr(34) * 2)}"')
+            where.append(f"py_contains(?, {column})")
+            params.append(term)
+        if match:
+            where.append("id IN (SELECT rowid FROM listings_fts WHERE listings_fts MATCH ?)")
+            params.append(" AND ".join(match))
+        with self._lock:
+            result = self._read("WHERE " + " AND ".join(where), params)
+            if (self.version, self._data_version()) == version:  # not written to since load()
+                self.queries.put(version, key, df.index.get_indexer(result.index))
+            return result
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "version": self.version,
+            "fts": self.fts,
+        }
+
+
+def _sql_value(v):
+    if hasattr(v, "item"):
+        v = v.item()
+    if isinstance(v, float) and v != v:
+        return None
+    return v
+
+
+def open_store(csv_path, backend="csv", db_path=None, sidecar=False, query_cache_bytes=QUERY_CACHE_BYTES):
+    if backend == "sqlite":
+        return SQLiteListingStore(db_path or os.path.splitext(csv_path)[0] + ".db", csv_path=csv_path,
+                                  query_cache_bytes=query_cache_bytes)
+    return ListingStore(csv_path, sidecar=sidecar, query_cache_bytes=query_cache_bytes)